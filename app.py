@@ -1,8 +1,18 @@
 import streamlit as st
-import pandas as pd
+import streamlit.components.v1 as components
+import hashlib
 import json
+import os
 from datetime import datetime
-import io
+from exports import EXPORT_FORMATS, export_bytes
+from formatting import format_currency, format_currency_column
+from imports import PAYMENT_METHODS, ZAKAT_TYPES, payment_errors, read_import_file, validate_payments
+from ledger import PaymentFilter
+from profiling import PROFILERS, is_admin, profile_rerun, section, timed
+from rice import KG_PER_JIWA, RicePriceHistory, RicePriceRegistry, fitrah_due, revalue_fitrah
+from storage import SORT_COLUMNS, VersionConflict, WriteBehindQueue, open_payment_store
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
 
 # Configure page
 st.set_page_config(
@@ -11,450 +21,138 @@ st.set_page_config(
     layout="wide"
 )
 
-# Custom CSS for Indonesian currency formatting and Islamic styling
-st.markdown("""
-<style>
-    /* Main background styling */
-    .stApp {
-        background: linear-gradient(135deg, #ADFF2F 0%, #98FB98 100%);
-        min-height: 100vh;
-    }
-    
-    /* Islamic ornament watermark */
-    .stApp::before {
-        content: '';
-        position: fixed;
-        bottom: 20px;
-        right: 20px;
-        width: 200px;
-        height: 200px;
-        background-image: url("data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 200 200'%3E%3Cg fill='%23228B22' opacity='0.3'%3E%3Cpath d='M100 20 L120 60 L160 60 L130 85 L140 125 L100 105 L60 125 L70 85 L40 60 L80 60 Z'/%3E%3Ccircle cx='100' cy='100' r='15' fill='%23FFD700'/%3E%3Cpath d='M100 130 Q90 140 80 130 Q90 120 100 130 Q110 120 120 130 Q110 140 100 130' fill='%23228B22'/%3E%3Cpath d='M70 50 Q65 45 60 50 Q65 55 70 50' fill='%23FFD700'/%3E%3Cpath d='M140 50 Q135 45 130 50 Q135 55 140 50' fill='%23FFD700'/%3E%3C/g%3E%3C/svg%3E");
-        background-size: contain;
-        background-repeat: no-repeat;
-        z-index: -1;
-        pointer-events: none;
-    }
-    
-    /* Main container styling */
-    .main > div {
-        padding: 2rem 1rem;
-        background: rgba(255, 255, 255, 0.9);
-        border-radius: 15px;
-        margin: 1rem;
-        box-shadow: 0 8px 32px rgba(34, 139, 34, 0.2);
-        backdrop-filter: blur(10px);
-        border: 1px solid rgba(255, 215, 0, 0.3);
-    }
-    
-    /* Sidebar styling */
-    .css-1d391kg {
-        background: linear-gradient(180deg, #228B22 0%, #32CD32 100%);
-        border-right: 3px solid #FFD700;
-    }
-    
-    .css-1d391kg .element-container {
-        color: white !important;
-    }
-    
-    /* Header styling with Islamic calligraphy feel */
-    h1, h2, h3 {
-        color: #1B4332 !important;
-        text-align: center;
-        font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-        text-shadow: 2px 2px 4px rgba(255, 215, 0, 0.3);
-        border-bottom: 3px solid #FFD700;
-        padding-bottom: 10px;
-        margin-bottom: 20px;
-    }
-    
-    /* Metric cards with Islamic theme */
-    .metric-card {
-        background: linear-gradient(135deg, #F0F8E8 0%, #E8F5E8 100%);
-        padding: 1.5rem;
-        border-radius: 15px;
-        box-shadow: 0 4px 15px rgba(34, 139, 34, 0.2);
-        text-align: center;
-        border: 2px solid #FFD700;
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .metric-card::before {
-        content: '';
-        position: absolute;
-        top: -50%;
-        left: -50%;
-        width: 200%;
-        height: 200%;
-        background: url("data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 60 60'%3E%3Cg fill='%23FFD700' opacity='0.1'%3E%3Cpath d='M30 5 L35 20 L50 20 L38 30 L43 45 L30 37 L17 45 L22 30 L10 20 L25 20 Z'/%3E%3C/g%3E%3C/svg%3E") repeat;
-        z-index: 0;
-    }
-    
-    .metric-card > * {
-        position: relative;
-        z-index: 1;
-    }
-    
-    .metric-value {
-        font-size: 2.2rem;
-        font-weight: bold;
-        color: #1B4332;
-        text-shadow: 1px 1px 2px rgba(255, 215, 0, 0.5);
-    }
-    
-    .metric-label {
-        color: #2E8B57;
-        font-size: 1rem;
-        font-weight: 600;
-        margin-bottom: 10px;
-    }
-    
-    /* Form styling with Lebaran theme */
-    .stTextInput > div > div > input,
-    .stNumberInput > div > div > input,
-    .stSelectbox > div > div > div {
-        background: rgba(255, 255, 255, 0.9);
-        border: 2px solid #98FB98;
-        border-radius: 10px;
-        color: #1B4332;
-        font-weight: 500;
-    }
-    
-    .stTextInput > div > div > input:focus,
-    .stNumberInput > div > div > input:focus,
-    .stSelectbox > div > div > div:focus {
-        border-color: #FFD700;
-        box-shadow: 0 0 10px rgba(255, 215, 0, 0.3);
-    }
-    
-    /* Button styling with Islamic theme */
-    .stButton > button {
-        background: linear-gradient(135deg, #228B22 0%, #32CD32 100%);
-        color: white;
-        border: 2px solid #FFD700;
-        border-radius: 25px;
-        font-weight: bold;
-        font-size: 1rem;
-        padding: 0.75rem 1.5rem;
-        transition: all 0.3s ease;
-        text-shadow: 1px 1px 2px rgba(0,0,0,0.3);
-    }
-    
-    .stButton > button:hover {
-        background: linear-gradient(135deg, #32CD32 0%, #228B22 100%);
-        transform: translateY(-2px);
-        box-shadow: 0 5px 15px rgba(34, 139, 34, 0.4);
-    }
-    
-    /* Primary button special styling */
-    .stButton > button[kind="primary"] {
-        background: linear-gradient(135deg, #FFD700 0%, #FFA500 100%);
-        color: #1B4332;
-        border-color: #228B22;
-    }
-    
-    .stButton > button[kind="primary"]:hover {
-        background: linear-gradient(135deg, #FFA500 0%, #FFD700 100%);
-    }
-    
-    /* Table styling for history */
-    .stDataFrame {
-        background: rgba(255, 255, 255, 0.95);
-        border-radius: 15px;
-        border: 2px solid #98FB98;
-        overflow: hidden;
-    }
-    
-    .stDataFrame table {
-        border-collapse: separate;
-        border-spacing: 0;
-    }
-    
-    .stDataFrame th {
-        background: linear-gradient(135deg, #228B22 0%, #32CD32 100%);
-        color: white;
-        font-weight: bold;
-        padding: 15px;
-        text-align: center;
-        border-bottom: 2px solid #FFD700;
-    }
-    
-    .stDataFrame td {
-        padding: 12px 15px;
-        border-bottom: 1px solid #E8F5E8;
-        text-align: center;
-    }
-    
-    .stDataFrame tr:nth-child(even) {
-        background: rgba(173, 255, 47, 0.1);
-    }
-    
-    .stDataFrame tr:hover {
-        background: rgba(255, 215, 0, 0.2);
-        transform: scale(1.01);
-        transition: all 0.2s ease;
-    }
-    
-    /* Form container styling */
-    .stForm {
-        background: rgba(255, 255, 255, 0.9);
-        border: 3px solid #FFD700;
-        border-radius: 20px;
-        padding: 2rem;
-        box-shadow: 0 10px 30px rgba(34, 139, 34, 0.2);
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .stForm::before {
-        content: '';
-        position: absolute;
-        top: 10px;
-        right: 10px;
-        width: 40px;
-        height: 40px;
-        background: url("data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 40 40'%3E%3Cg fill='%23FFD700' opacity='0.3'%3E%3Cpath d='M20 5 L23 15 L33 15 L25 22 L28 32 L20 27 L12 32 L15 22 L7 15 L17 15 Z'/%3E%3C/g%3E%3C/svg%3E");
-        background-size: contain;
-    }
-    
-    /* Success/Error message styling */
-    .stSuccess {
-        background: linear-gradient(135deg, #90EE90 0%, #98FB98 100%);
-        border: 2px solid #32CD32;
-        border-radius: 10px;
-        color: #1B4332;
-    }
-    
-    .stError {
-        background: linear-gradient(135deg, #FFB6C1 0%, #FFA07A 100%);
-        border: 2px solid #DC143C;
-        border-radius: 10px;
-    }
-    
-    /* Info box styling */
-    .stInfo {
-        background: linear-gradient(135deg, #E0F6FF 0%, #87CEEB 100%);
-        border: 2px solid #4169E1;
-        border-radius: 10px;
-        color: #1B4332;
-    }
-    
-    /* Sidebar title styling */
-    .css-1d391kg h1 {
-        color: #FFD700 !important;
-        text-align: center;
-        border-bottom: 2px solid #FFD700;
-        padding-bottom: 10px;
-    }
-    
-    /* Islamic ornament for corners */
-    .corner-ornament {
-        position: fixed;
-        width: 80px;
-        height: 80px;
-        opacity: 0.2;
-        z-index: -1;
-        pointer-events: none;
-    }
-    
-    .corner-ornament.top-left {
-        top: 20px;
-        left: 20px;
-    }
-    
-    .corner-ornament.top-right {
-        top: 20px;
-        right: 20px;
-    }
-    
-    .corner-ornament.bottom-left {
-        bottom: 20px;
-        left: 20px;
-    }
-    
-    /* Rice bag icon for data beras page */
-    .rice-icon {
-        position: absolute;
-        top: 10px;
-        left: 10px;
-        width: 60px;
-        height: 60px;
-        opacity: 0.4;
-        background: url("data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 60 60'%3E%3Cg fill='%23D2691E'%3E%3Crect x='15' y='20' width='30' height='25' rx='5' ry='5'/%3E%3Ctext x='30' y='35' text-anchor='middle' fill='white' font-size='8' font-weight='bold'%3EBERAS%3C/text%3E%3Ccircle cx='20' cy='15' r='2' fill='%23F5DEB3'/%3E%3Ccircle cx='25' cy='12' r='1.5' fill='%23F5DEB3'/%3E%3Ccircle cx='30' cy='14' r='1.5' fill='%23F5DEB3'/%3E%3Ccircle cx='35' cy='11' r='2' fill='%23F5DEB3'/%3E%3Ccircle cx='40' cy='15' r='1.5' fill='%23F5DEB3'/%3E%3C/g%3E%3C/svg%3E");
-        background-size: contain;
-        background-repeat: no-repeat;
-    }
-    
-    /* Money/envelope icon for payment page */
-    .money-icon {
-        position: absolute;
-        top: 10px;
-        right: 10px;
-        width: 60px;
-        height: 60px;
-        opacity: 0.4;
-        background: url("data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 60 60'%3E%3Cg fill='%23FFD700'%3E%3Crect x='10' y='20' width='40' height='25' rx='3' ry='3' stroke='%23228B22' stroke-width='2'/%3E%3Ccircle cx='30' cy='32.5' r='6' fill='%23228B22'/%3E%3Ctext x='30' y='36' text-anchor='middle' fill='%23FFD700' font-size='8' font-weight='bold'%3ERp%3C/text%3E%3Cpath d='M15 20 L30 30 L45 20' stroke='%23228B22' stroke-width='2' fill='none'/%3E%3C/g%3E%3C/svg%3E");
-        background-size: contain;
-        background-repeat: no-repeat;
-    }
-    
-    /* Calendar icon for dates */
-    .calendar-icon {
-        display: inline-block;
-        width: 16px;
-        height: 16px;
-        margin-right: 5px;
-        background: url("data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 16 16'%3E%3Cg fill='%23228B22'%3E%3Crect x='2' y='3' width='12' height='11' rx='1' ry='1' stroke='%23228B22' stroke-width='1' fill='%23F0F8E8'/%3E%3Cline x1='5' y1='1' x2='5' y2='5' stroke='%23228B22' stroke-width='1'/%3E%3Cline x1='11' y1='1' x2='11' y2='5' stroke='%23228B22' stroke-width='1'/%3E%3Cline x1='2' y1='6' x2='14' y2='6' stroke='%23228B22' stroke-width='1'/%3E%3C/g%3E%3C/svg%3E");
-        background-size: contain;
-        background-repeat: no-repeat;
-        vertical-align: middle;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Styling and corner ornaments live in static/ and are fetched once per browser
+# tab; Streamlit serves .css as text/plain, so they are injected rather than linked
+@st.cache_resource
+def static_url(name):
+    """Versioned URL of a static/ file, cached by the browser until its content changes"""
+    with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+        return f"app/static/{name}?v={hashlib.md5(f.read()).hexdigest()[:12]}"
+
+def load_theme():
+    """Add the stylesheet and ornaments to the page unless this version is already there"""
+    components.html(f"""
+<script>
+const page = window.parent.document;
+async function inject(id, src, tag, parent) {{
+    const current = page.getElementById(id);
+    if (current && current.dataset.src === src) return;
+    const response = await fetch(new URL(src, page.baseURI));
+    const node = page.createElement(tag);
+    node.id = id;
+    node.dataset.src = src;
+    node.innerHTML = await response.text();
+    current ? current.replaceWith(node) : parent.appendChild(node);
+}}
+inject("zakat-theme", "{static_url('zakat.css')}", "style", page.head);
+inject("zakat-ornaments", "{static_url('ornaments.html')}", "div", page.querySelector(".stApp") || page.body);
+</script>
+""", height=0)
+
+load_theme()
 
-# Add corner ornaments
-st.markdown("""
-<div class="corner-ornament top-left">
-    <svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 80 80">
-        <g fill="#FFD700" opacity="0.3">
-            <path d="M10 10 Q20 5 30 10 Q20 15 10 10"/>
-            <path d="M40 10 Q50 5 60 10 Q50 15 40 10"/>
-            <path d="M10 30 Q20 25 30 30 Q20 35 10 30"/>
-            <path d="M40 30 Q50 25 60 30 Q50 35 40 30"/>
-            <circle cx="35" cy="50" r="8" fill="#228B22"/>
-            <path d="M35 58 Q30 63 25 58 Q30 53 35 58 Q40 53 45 58 Q40 63 35 58"/>
-        </g>
-    </svg>
-</div>
-<div class="corner-ornament top-right">
-    <svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 80 80">
-        <g fill="#32CD32" opacity="0.3">
-            <path d="M20 15 L25 25 L35 25 L28 32 L31 42 L20 37 L9 42 L12 32 L5 25 L15 25 Z"/>
-            <circle cx="20" cy="55" r="6" fill="#FFD700"/>
-            <path d="M50 20 Q55 15 60 20 Q55 25 50 20"/>
-            <path d="M65 35 Q70 30 75 35 Q70 40 65 35"/>
-        </g>
-    </svg>
-</div>
-<div class="corner-ornament bottom-left">
-    <svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 80 80">
-        <g fill="#228B22" opacity="0.2">
-            <circle cx="25" cy="25" r="12" fill="none" stroke="#FFD700" stroke-width="2"/>
-            <path d="M25 13 L28 20 L35 20 L30 25 L32 32 L25 28 L18 32 L20 25 L15 20 L22 20 Z"/>
-            <path d="M50 60 Q60 55 70 60 Q60 65 50 60"/>
-        </g>
-    </svg>
-</div>
-""", unsafe_allow_html=True)
+# Shared payment store, opened once per server process
+@st.cache_resource
+def get_payment_store():
+    """Open the payment store configured for this deployment"""
+    return open_payment_store()
+
+# New payments are written by a background thread, so a submit never waits on the disk
+@st.cache_resource
+def get_payment_writer():
+    """Write-behind queue in front of the shared payment store"""
+    return WriteBehindQueue(get_payment_store())
 
 # Initialize session state for data persistence
 def initialize_session_state():
-    if 'zakat_payments' not in st.session_state:
-        st.session_state.zakat_payments = []
-    
     if 'rice_prices' not in st.session_state:
-        st.session_state.rice_prices = [
-            {"id": 1, "harga": 10000.00},
-            {"id": 2, "harga": 15000.00},
-            {"id": 3, "harga": 20000.00},
-            {"id": 4, "harga": 17000.00},
-            {"id": 5, "harga": 13500.00}
-        ]
+        st.session_state.rice_prices = RicePriceRegistry([10000.00, 15000.00, 20000.00, 17000.00, 13500.00])
 
 # Helper functions
-def format_currency(amount):
-    """Format number as Indonesian Rupiah"""
-    return f"Rp {amount:,.2f}".replace(",", ".")
-
 def get_zakat_types():
     """Get available zakat types"""
-    return [
-        "Zakat Fitrah",
-        "Zakat Mal",
-        "Zakat Profesi",
-        "Zakat Emas",
-        "Zakat Perak",
-        "Zakat Perdagangan"
-    ]
+    return list(ZAKAT_TYPES)
 
 def get_payment_methods():
     """Get available payment methods"""
-    return [
-        "Tunai",
-        "Transfer Bank",
-        "E-Wallet",
-        "Kartu Kredit"
-    ]
+    return list(PAYMENT_METHODS)
 
 def save_payment(payment_data):
-    """Save payment to session state"""
-    payment_data['id'] = len(st.session_state.zakat_payments) + 1
+    """Queue a payment to be saved to the payment store"""
     payment_data['tanggal_input'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    st.session_state.zakat_payments.append(payment_data)
+    get_payment_writer().enqueue(payment_data)
 
-def delete_payment(payment_id):
-    """Delete payment from session state"""
-    st.session_state.zakat_payments = [
-        p for p in st.session_state.zakat_payments if p['id'] != payment_id
-    ]
+def conflict_message(conflict):
+    """Explain to the user that another session changed a payment first"""
+    if conflict.current is None:
+        return f"⚠️ Pembayaran ID {conflict.payment_id} sudah dihapus oleh pengguna lain."
+    return (f"⚠️ Pembayaran ID {conflict.payment_id} baru saja diubah oleh pengguna lain. "
+            "Periksa data terbarunya lalu ulangi perubahan Anda.")
 
-def update_payment(payment_id, updated_data):
-    """Update payment in session state"""
-    for i, payment in enumerate(st.session_state.zakat_payments):
-        if payment['id'] == payment_id:
-            updated_data['id'] = payment_id
-            updated_data['tanggal_input'] = payment.get('tanggal_input', datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-            st.session_state.zakat_payments[i] = updated_data
-            break
+def delete_payment(payment_id, expected_version=None):
+    """Delete payment from the payment store, unless another session changed it since it was shown"""
+    try:
+        get_payment_store().delete(payment_id, expected_version)
+    except VersionConflict as conflict:
+        st.session_state.payment_notice = ('error', conflict_message(conflict))
+    else:
+        st.session_state.payment_notice = ('success', f"✅ Pembayaran ID {payment_id} berhasil dihapus")
+
+def update_payment(payment_id, updated_data, expected_version=None):
+    """Update payment in the payment store; raises VersionConflict if another session changed it first"""
+    get_payment_store().update(payment_id, updated_data, expected_version)
+
+def start_edit(payment_data):
+    """Open the edit form on the payment as it was shown, versi included"""
+    st.session_state.edit_payment = payment_data
+
+def delete_all_payments(timeout=10):
+    """Delete every payment from the payment store, including those still queued
+
+    Returns False, deleting nothing, if the queued payments are not stored
+    within ``timeout`` seconds.
+    """
+    if not get_payment_writer().flush(timeout):
+        return False
+    get_payment_store().clear()
+    return True
+
+def import_payments(payments):
+    """Save validated payments from an import file in one batch"""
+    records = payments.assign(tanggal_input=datetime.now().strftime("%Y-%m-%d %H:%M:%S")).to_dict('records')
+    return get_payment_store().add_many(records)
 
 def add_rice_price(price):
     """Add new rice price"""
-    new_id = max([rp['id'] for rp in st.session_state.rice_prices], default=0) + 1
-    st.session_state.rice_prices.append({"id": new_id, "harga": price})
+    return st.session_state.rice_prices.add(price)
+
+def fill_fitrah(jumlah_jiwa, total_bayar):
+    """Copy a zakat fitrah calculation into the payment form"""
+    st.session_state.payment_jiwa = jumlah_jiwa
+    st.session_state.payment_jenis = "Zakat Fitrah"
+    st.session_state.payment_total = total_bayar
 
 def delete_rice_price(price_id):
     """Delete rice price"""
-    st.session_state.rice_prices = [
-        rp for rp in st.session_state.rice_prices if rp['id'] != price_id
-    ]
+    st.session_state.rice_prices.delete(price_id)
 
-def export_to_excel():
-    """Export payments to Excel"""
-    if not st.session_state.zakat_payments:
+def get_rice_price_history():
+    """Reference rice prices by effective date, as saved with the payments"""
+    return RicePriceHistory(get_payment_store().rice_price_history())
+
+def export_payments(file_format="Excel", filters=None):
+    """Export payments as Excel, CSV, Parquet or Arrow"""
+    store = get_payment_store()
+    if not store.count(filters):
         return None
     
-    df = pd.DataFrame(st.session_state.zakat_payments)
-    
-    # Reorder columns for better presentation
-    column_order = ['id', 'nama', 'jumlah_jiwa', 'jenis_zakat', 'metode_pembayaran', 
-                   'total_bayar', 'nominal_dibayar', 'kembalian', 'tanggal_bayar', 'tanggal_input']
-    
-    # Only include columns that exist
-    available_columns = [col for col in column_order if col in df.columns]
-    df = df[available_columns]
-    
-    # Rename columns to Indonesian
-    column_names = {
-        'id': 'ID',
-        'nama': 'Nama',
-        'jumlah_jiwa': 'Jumlah Jiwa',
-        'jenis_zakat': 'Jenis Zakat',
-        'metode_pembayaran': 'Metode Pembayaran',
-        'total_bayar': 'Total Bayar',
-        'nominal_dibayar': 'Nominal Dibayar',
-        'kembalian': 'Kembalian',
-        'tanggal_bayar': 'Tanggal Bayar',
-        'tanggal_input': 'Tanggal Input'
-    }
-    
-    df = df.rename(columns=column_names)
-    
-    # Convert to Excel
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Pembayaran Zakat')
-    
-    return output.getvalue()
+    # Streamed from the store chunk by chunk, with the columns and headers in exports.py
+    return export_bytes(store, file_format, filters)
+
+@st.cache_resource(max_entries=len(EXPORT_FORMATS), show_spinner="⏳ Menyiapkan file export...")
+def get_export(ledger_version, file_format, filters=None):
+    """Export file for one ledger version; only rebuilt after the ledger changes"""
+    return export_payments(file_format, filters)
 
 # Main application
 def main():
@@ -470,18 +168,75 @@ def main():
         st.sidebar.markdown("---")
         menu = st.sidebar.selectbox(
             "Pilih Menu:",
-            ["Dashboard", "Tambah Pembayaran", "Riwayat Pembayaran", "Data Harga Beras"]
+            ["Dashboard", "Tambah Pembayaran", "Riwayat Pembayaran", "Laporan Ringkasan", "Data Harga Beras"]
         )
     
-    if menu == "Dashboard":
-        show_dashboard()
-    elif menu == "Tambah Pembayaran":
-        show_payment_form()
-    elif menu == "Riwayat Pembayaran":
-        show_payment_history()
-    elif menu == "Data Harga Beras":
-        show_rice_prices()
+    # Timings are only recorded when ZAKAT_PROFILE is set
+    with profile_rerun(menu, st.session_state.setdefault('profile_history', []),
+                       st.session_state.pop('profile_next', None)):
+        if menu == "Dashboard":
+            show_dashboard()
+        elif menu == "Tambah Pembayaran":
+            show_payment_form()
+        elif menu == "Riwayat Pembayaran":
+            show_payment_history()
+        elif menu == "Laporan Ringkasan":
+            show_rollup_report()
+        elif menu == "Data Harga Beras":
+            show_rice_prices()
+    
+    show_pending_writes()
+    
+    if is_admin(st.query_params.get('admin')):
+        show_performance_panel()
+
+def show_pending_writes():
+    """Sidebar notice while submitted payments are still being written"""
+    writer = get_payment_writer()
+    pending = writer.pending
+    if writer.failed:
+        names = ', '.join(str(payment.get('nama')) for payment, _ in writer.failed[-5:])
+        st.sidebar.error(f"❌ {len(writer.failed)} pembayaran gagal disimpan dan dilewati: {names}")
+    if writer.last_error is not None:
+        st.sidebar.error(f"⚠️ {pending} pembayaran belum tersimpan, penyimpanan sedang dicoba ulang")
+    elif pending:
+        st.sidebar.info(f"⏳ {pending} pembayaran sedang disimpan...")
+
+def show_performance_panel():
+    """Sidebar panel with this session's rerun timings and on-demand profiles"""
+    import pandas as pd
+
+    history = st.session_state.profile_history
+    with st.sidebar.expander("⏱️ Performa", expanded=False):
+        if history:
+            last = history[-1]
+            st.metric(f"Rerun terakhir ({last['page']})", f"{last['total_ms']:.0f} ms")
+            st.dataframe(pd.DataFrame(sorted(last['sections'].items()), columns=['Bagian', 'ms']),
+                         use_container_width=True, hide_index=True)
+            st.caption("Rerun sebelumnya")
+            st.dataframe(pd.DataFrame([(r['time'], r['page'], r['total_ms']) for r in reversed(history)],
+                                      columns=['Waktu', 'Halaman', 'ms']),
+                         use_container_width=True, hide_index=True)
+        else:
+            st.caption("Belum ada rerun yang tercatat")
+        
+        profiler = st.selectbox("Profiler", PROFILERS, key="profile_with")
+        if st.button("🧪 Profil Rerun Berikutnya", use_container_width=True):
+            st.session_state.profile_next = profiler
+            st.rerun()
+        
+        profiled = [r for r in history if 'profile' in r]
+        if profiled:
+            latest = profiled[-1]
+            with open(latest['profile'], 'rb') as f:
+                st.download_button("⬇️ Unduh Profil", data=f.read(),
+                                   file_name=os.path.basename(latest['profile']), use_container_width=True)
+            st.code(latest['profile_summary'], language=None)
 
+# Dashboard auto-refresh choices in seconds; None is off
+REFRESH_INTERVALS = [None, 5, 10, 30, 60]
+
+@timed('show_dashboard')
 def show_dashboard():
     """Display main dashboard"""
     st.title("🌙 Dashboard Pembayaran Zakat Lebaran 🌙")
@@ -499,9 +254,47 @@ def show_dashboard():
     </div>
     """, unsafe_allow_html=True)
     
-    # Calculate statistics
-    total_payments = sum([p['total_bayar'] for p in st.session_state.zakat_payments])
-    transaction_count = len(st.session_state.zakat_payments)
+    # A wall display can open the dashboard with ?refresh=<seconds>
+    if 'dashboard_refresh' not in st.session_state:
+        requested = st.query_params.get('refresh', '')
+        requested = int(requested) if requested.isdigit() else None
+        st.session_state.dashboard_refresh = requested if requested in REFRESH_INTERVALS else None
+    _, col = st.columns([3, 1])
+    with col:
+        refresh = st.selectbox("🔄 Perbarui otomatis", REFRESH_INTERVALS, key="dashboard_refresh",
+                               format_func=lambda seconds: "Mati" if seconds is None else f"Setiap {seconds} detik")
+    
+    # Only these fragments rerun on each refresh, not the whole script
+    st.fragment(show_dashboard_totals, run_every=refresh)()
+    st.fragment(show_recent_payments, run_every=refresh)()
+    
+    # Action buttons
+    st.markdown("<br>", unsafe_allow_html=True)
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        if st.button("➕ Tambah Pembayaran Zakat", type="primary", use_container_width=True):
+            st.session_state.menu_override = "Tambah Pembayaran"
+            st.rerun()
+    
+    with col2:
+        if st.button("📊 Riwayat Pembayaran", use_container_width=True):
+            st.session_state.menu_override = "Riwayat Pembayaran"
+            st.rerun()
+    
+    with col3:
+        if st.button("🌾 Data Harga Beras", use_container_width=True):
+            st.session_state.menu_override = "Data Harga Beras"
+            st.rerun()
+
+@timed('show_dashboard_totals')
+def show_dashboard_totals():
+    """Metric cards and per-category totals of the dashboard"""
+    # Read running totals (kept up to date by every save/update/delete)
+    store = get_payment_store()
+    summary = store.summary()
+    total_payments = summary['total_bayar']
+    transaction_count = summary['count']
     last_update = datetime.now().strftime("%a, %d %b %Y %H:%M:%S GMT")
     
     # Display metrics in columns
@@ -533,29 +326,51 @@ def show_dashboard():
     
     st.markdown("<br>", unsafe_allow_html=True)
     
-    # Recent payments table
+    # Breakdown per zakat type and payment method
+    if transaction_count:
+        import pandas as pd
+
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("🕌 Rekap per Jenis Zakat")
+            st.dataframe(pd.DataFrame(
+                [(jenis, count, format_currency(total)) for jenis, (count, total) in summary['jenis_zakat'].items()],
+                columns=['Jenis Zakat', 'Jumlah Transaksi', 'Total Bayar']
+            ), use_container_width=True, hide_index=True)
+        
+        with col2:
+            st.subheader("💳 Rekap per Metode Pembayaran")
+            st.dataframe(pd.DataFrame(
+                [(metode, count, format_currency(total)) for metode, (count, total) in summary['metode_pembayaran'].items()],
+                columns=['Metode Pembayaran', 'Jumlah Transaksi', 'Total Bayar']
+            ), use_container_width=True, hide_index=True)
+        
+        st.caption(f"💵 Total kembalian yang diberikan: {format_currency(summary['kembalian'])}")
+
+@timed('show_recent_payments')
+def show_recent_payments():
+    """The dashboard's table of the latest payments"""
+    store = get_payment_store()
     st.subheader("📋 Daftar Pembayaran Terbaru")
     
-    if st.session_state.zakat_payments:
+    if store.count():
         # Get last 5 payments
-        recent_payments = st.session_state.zakat_payments[-5:]
-        
-        # Create DataFrame for display
-        df_display = pd.DataFrame(recent_payments)
+        with section('data'):
+            df_display = store.recent(5)
         
         # Format currency columns
-        if 'total_bayar' in df_display.columns:
-            df_display['total_bayar'] = df_display['total_bayar'].apply(format_currency)
-        if 'nominal_dibayar' in df_display.columns:
-            df_display['nominal_dibayar'] = df_display['nominal_dibayar'].apply(format_currency)
-        if 'kembalian' in df_display.columns:
-            df_display['kembalian'] = df_display['kembalian'].apply(format_currency)
+        with section('format'):
+            if 'total_bayar' in df_display.columns:
+                df_display['total_bayar'] = format_currency_column(df_display['total_bayar'])
+            if 'nominal_dibayar' in df_display.columns:
+                df_display['nominal_dibayar'] = format_currency_column(df_display['nominal_dibayar'])
+            if 'kembalian' in df_display.columns:
+                df_display['kembalian'] = format_currency_column(df_display['kembalian'])
         
         # Add calendar icon to dates
         if 'tanggal_bayar' in df_display.columns:
-            df_display['tanggal_bayar'] = df_display['tanggal_bayar'].apply(
-                lambda x: f"📅 {x}" if pd.notna(x) else ""
-            )
+            df_display['tanggal_bayar'] = ("📅 " + df_display['tanggal_bayar']).fillna("")
         
         # Rename columns
         column_renames = {
@@ -576,29 +391,12 @@ def show_dashboard():
         # Show only selected columns
         available_display_cols = [col for col in display_columns if col in df_display.columns]
         if available_display_cols:
-            st.dataframe(df_display[available_display_cols], use_container_width=True)
+            with section('render'):
+                st.dataframe(df_display[available_display_cols], use_container_width=True)
     else:
         st.info("🌙 Belum ada data pembayaran zakat. Mari mulai dengan menambahkan pembayaran pertama!")
-    
-    # Action buttons
-    st.markdown("<br>", unsafe_allow_html=True)
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        if st.button("➕ Tambah Pembayaran Zakat", type="primary", use_container_width=True):
-            st.session_state.menu_override = "Tambah Pembayaran"
-            st.rerun()
-    
-    with col2:
-        if st.button("📊 Riwayat Pembayaran", use_container_width=True):
-            st.session_state.menu_override = "Riwayat Pembayaran"
-            st.rerun()
-    
-    with col3:
-        if st.button("🌾 Data Harga Beras", use_container_width=True):
-            st.session_state.menu_override = "Data Harga Beras"
-            st.rerun()
 
+@timed('show_payment_form')
 def show_payment_form():
     """Display payment form with Islamic theme"""
     st.title("💰 Melakukan Pembayaran Zakat")
@@ -617,21 +415,38 @@ def show_payment_form():
     </div>
     """, unsafe_allow_html=True)
     
+    # Zakat fitrah calculator: jiwa x kg per jiwa x chosen rice price
+    with st.expander("🌾 Hitung Zakat Fitrah"):
+        rice_prices = st.session_state.rice_prices
+        if rice_prices:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                fitrah_jiwa = st.number_input("Jumlah Jiwa", min_value=1, step=1, key="fitrah_jiwa")
+            with col2:
+                harga = st.selectbox("Harga Beras per Kg", rice_prices.tiers(), format_func=format_currency,
+                                     key="fitrah_harga")
+            fitrah_total = float(fitrah_due(fitrah_jiwa, harga))
+            with col3:
+                st.metric(f"Zakat Fitrah ({fitrah_jiwa} jiwa × {KG_PER_JIWA:g} kg)", format_currency(fitrah_total))
+            st.button("📝 Isi ke Formulir", on_click=fill_fitrah, args=(fitrah_jiwa, fitrah_total))
+        else:
+            st.info("🌾 Belum ada data harga beras. Tambahkan melalui menu 'Data Harga Beras'.")
+    
     with st.form("payment_form"):
         col1, col2 = st.columns(2)
         
         with col1:
             st.markdown("### 👤 Data Muzakki")
             nama = st.text_input("Nama Lengkap*", placeholder="Masukkan nama lengkap")
-            jumlah_jiwa = st.number_input("Jumlah Jiwa dalam Keluarga", min_value=1, value=1, step=1, 
+            jumlah_jiwa = st.number_input("Jumlah Jiwa dalam Keluarga", min_value=1, step=1, key="payment_jiwa",
                                         help="Jumlah anggota keluarga yang akan dibayarkan zakatnya")
-            jenis_zakat = st.selectbox("Jenis Zakat*", ["Pilih Jenis Zakat"] + get_zakat_types())
+            jenis_zakat = st.selectbox("Jenis Zakat*", ["Pilih Jenis Zakat"] + get_zakat_types(), key="payment_jenis")
             metode_pembayaran = st.selectbox("Metode Pembayaran*", ["Pilih Metode Pembayaran"] + get_payment_methods())
         
         with col2:
             st.markdown("### 💳 Informasi Pembayaran")
             total_bayar = st.number_input("Total Bayar (Rp)*", min_value=0.0, format="%.2f", step=1000.0,
-                                        help="Jumlah zakat yang harus dibayar")
+                                        key="payment_total", help="Jumlah zakat yang harus dibayar")
             nominal_dibayar = st.number_input("Nominal Dibayar (Rp)*", min_value=0.0, format="%.2f", step=1000.0,
                                             help="Jumlah uang yang diberikan")
             
@@ -650,37 +465,24 @@ def show_payment_form():
             cancel = st.form_submit_button("🔙 Kembali ke Dashboard", use_container_width=True)
         
         if submit:
-            # Validation
-            errors = []
-            if not nama.strip():
-                errors.append("❌ Nama harus diisi")
-            if jenis_zakat == "Pilih Jenis Zakat":
-                errors.append("❌ Pilih jenis zakat")
-            if metode_pembayaran == "Pilih Metode Pembayaran":
-                errors.append("❌ Pilih metode pembayaran")
-            if total_bayar <= 0:
-                errors.append("❌ Total bayar harus lebih dari 0")
-            if nominal_dibayar <= 0:
-                errors.append("❌ Nominal dibayar harus lebih dari 0")
-            if nominal_dibayar < total_bayar:
-                errors.append("❌ Nominal dibayar tidak boleh kurang dari total bayar")
+            # Validation, with the same rules as imports and the ingest API
+            payment_data = {
+                'nama': nama.strip(),
+                'jumlah_jiwa': jumlah_jiwa,
+                'jenis_zakat': '' if jenis_zakat == "Pilih Jenis Zakat" else jenis_zakat,
+                'metode_pembayaran': '' if metode_pembayaran == "Pilih Metode Pembayaran" else metode_pembayaran,
+                'total_bayar': total_bayar,
+                'nominal_dibayar': nominal_dibayar,
+                'kembalian': kembalian,
+                'tanggal_bayar': tanggal_bayar.strftime("%Y-%m-%d")
+            }
+            errors = [f"❌ {message}" for message in payment_errors(payment_data)]
             
             if errors:
                 for error in errors:
                     st.error(error)
             else:
                 # Save payment
-                payment_data = {
-                    'nama': nama.strip(),
-                    'jumlah_jiwa': jumlah_jiwa,
-                    'jenis_zakat': jenis_zakat,
-                    'metode_pembayaran': metode_pembayaran,
-                    'total_bayar': total_bayar,
-                    'nominal_dibayar': nominal_dibayar,
-                    'kembalian': kembalian,
-                    'tanggal_bayar': tanggal_bayar.strftime("%Y-%m-%d")
-                }
-                
                 save_payment(payment_data)
                 st.success("✅ Alhamdulillah! Pembayaran zakat berhasil disimpan. Barakallahu fiikum!")
                 st.balloons()
@@ -692,6 +494,7 @@ def show_payment_form():
             st.session_state.menu_override = "Dashboard"
             st.rerun()
 
+@timed('show_payment_history')
 def show_payment_history():
     """Display payment history with CRUD operations"""
     st.title("📚 Riwayat Pembayaran Zakat")
@@ -707,6 +510,34 @@ def show_payment_history():
     </div>
     """, unsafe_allow_html=True)
     
+    # Outcome of the last edit or delete, set before that rerun
+    if 'payment_notice' in st.session_state:
+        level, message = st.session_state.pop('payment_notice')
+        getattr(st, level)(message)
+    
+    store = get_payment_store()
+    ledger_version = store.version
+    transaction_count = store.count()
+    
+    # Filters apply to both the table and the export
+    with st.expander("🔎 Filter Riwayat"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            date_range = st.date_input("📅 Tanggal Bayar (rentang)", value=(), key="filter_dates")
+        with col2:
+            jenis_filter = st.multiselect("Jenis Zakat", get_zakat_types(), key="filter_jenis")
+        with col3:
+            metode_filter = st.multiselect("Metode Pembayaran", get_payment_methods(), key="filter_metode")
+    
+    # A single picked date filters on that one day
+    filters = PaymentFilter(
+        date_from=date_range[0].strftime("%Y-%m-%d") if date_range else None,
+        date_to=date_range[-1].strftime("%Y-%m-%d") if date_range else None,
+        jenis_zakat=tuple(jenis_filter),
+        metode_pembayaran=tuple(metode_filter)
+    )
+    filtered_count = store.count(filters)
+    
     # Action buttons
     col1, col2, col3, col4 = st.columns([1, 1, 1, 2])
     
@@ -715,24 +546,36 @@ def show_payment_history():
             st.session_state.menu_override = "Dashboard"
             st.rerun()
     
+    with col4:
+        export_format = st.selectbox("Format Export", list(EXPORT_FORMATS),
+                                     label_visibility="collapsed",
+                                     help="Format file export")
+    
     with col2:
-        excel_data = export_to_excel()
-        if excel_data:
+        # The file is only generated once asked for, then reused until the ledger changes
+        extension, mime, _ = EXPORT_FORMATS[export_format]
+        if not filtered_count:
+            st.button(f"📊 Export {export_format}", disabled=True, use_container_width=True, 
+                     help="Tidak ada data untuk diekspor")
+        elif st.session_state.get('export_prepared') == (export_format, ledger_version, filters):
+            with section('export'):
+                data = get_export(ledger_version, export_format, filters)
             st.download_button(
-                label="📊 Export Excel",
-                data=excel_data,
-                file_name=f"pembayaran_zakat_lebaran_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                label=f"⬇️ Unduh {export_format}",
+                data=data,
+                file_name=f"pembayaran_zakat_lebaran_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+                mime=mime,
                 use_container_width=True
             )
-        else:
-            st.button("📊 Export Excel", disabled=True, use_container_width=True, 
-                     help="Tidak ada data untuk diekspor")
+        elif st.button(f"📊 Export {export_format}", use_container_width=True,
+                       help=f"Siapkan file {export_format} untuk diunduh"):
+            st.session_state.export_prepared = (export_format, ledger_version, filters)
+            st.rerun()
     
     with col3:
         if st.button("🗑️ Hapus Semua", use_container_width=True, 
                      help="Hapus semua data pembayaran"):
-            if st.session_state.zakat_payments:
+            if transaction_count:
                 # Show confirmation in session state
                 st.session_state.show_delete_all_confirm = True
     
@@ -742,35 +585,27 @@ def show_payment_history():
         col1, col2 = st.columns(2)
         with col1:
             if st.button("✅ Ya, Hapus Semua", type="primary"):
-                st.session_state.zakat_payments = []
-                st.session_state.show_delete_all_confirm = False
-                st.success("✅ Semua data pembayaran berhasil dihapus")
-                st.rerun()
+                if delete_all_payments():
+                    st.session_state.show_delete_all_confirm = False
+                    st.success("✅ Semua data pembayaran berhasil dihapus")
+                    st.rerun()
+                else:
+                    st.error("❌ Pembayaran yang masih antre belum tersimpan, data belum dihapus. Silakan coba lagi.")
         with col2:
             if st.button("❌ Batal"):
                 st.session_state.show_delete_all_confirm = False
                 st.rerun()
     
+    show_payment_import()
+    
     st.markdown("---")
     
     # Display payments table
-    if st.session_state.zakat_payments:
-        st.subheader(f"📋 Daftar Pembayaran ({len(st.session_state.zakat_payments)} transaksi)")
-        
-        # Create DataFrame
-        df = pd.DataFrame(st.session_state.zakat_payments)
-        
-        # Format currency columns
-        currency_columns = ['total_bayar', 'nominal_dibayar', 'kembalian']
-        for col in currency_columns:
-            if col in df.columns:
-                df[col] = df[col].apply(format_currency)
-        
-        # Add calendar icons to dates
-        if 'tanggal_bayar' in df.columns:
-            df['tanggal_bayar'] = df['tanggal_bayar'].apply(
-                lambda x: f"📅 {x}" if pd.notna(x) else ""
-            )
+    if filtered_count:
+        if any(filters):
+            st.subheader(f"📋 Daftar Pembayaran ({filtered_count} dari {transaction_count} transaksi)")
+        else:
+            st.subheader(f"📋 Daftar Pembayaran ({transaction_count} transaksi)")
         
         # Rename columns for display
         column_renames = {
@@ -786,6 +621,36 @@ def show_payment_history():
             'tanggal_input': 'Tanggal Input'
         }
         
+        # Only the visible page is read, formatted and sent to the browser
+        col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+        with col1:
+            sort_by = st.selectbox("Urutkan berdasarkan", SORT_COLUMNS,
+                                   format_func=column_renames.get, key="history_sort")
+        with col2:
+            descending = st.selectbox("Urutan", ["Menurun", "Menaik"], key="history_order") == "Menurun"
+        with col3:
+            page_size = st.selectbox("Baris per halaman", [25, 50, 100, 250], key="history_page_size")
+        page_count = -(-filtered_count // page_size)
+        if st.session_state.get('history_page', 1) > page_count:
+            st.session_state.history_page = page_count
+        with col4:
+            page_number = st.number_input(f"Halaman (dari {page_count})", min_value=1, max_value=page_count,
+                                          step=1, key="history_page")
+        
+        with section('data'):
+            df = store.page((page_number - 1) * page_size, page_size, sort_by, descending, filters)
+        
+        # Format currency columns
+        currency_columns = ['total_bayar', 'nominal_dibayar', 'kembalian']
+        with section('format'):
+            for col in currency_columns:
+                if col in df.columns:
+                    df[col] = format_currency_column(df[col])
+        
+        # Add calendar icons to dates
+        if 'tanggal_bayar' in df.columns:
+            df['tanggal_bayar'] = ("📅 " + df['tanggal_bayar']).fillna("")
+        
         df_display = df.rename(columns=column_renames)
         
         # Select columns to display
@@ -794,48 +659,80 @@ def show_payment_history():
         available_columns = [col for col in display_columns if col in df_display.columns]
         
         if available_columns:
-            st.dataframe(df_display[available_columns], use_container_width=True)
+            with section('render'):
+                st.dataframe(df_display[available_columns], use_container_width=True, hide_index=True)
+            st.caption(f"Menampilkan {(page_number - 1) * page_size + 1}–"
+                       f"{(page_number - 1) * page_size + len(df)} dari {filtered_count} transaksi")
         
         # Individual record management
         st.markdown("---")
         st.subheader("🔧 Kelola Data Pembayaran")
         
-        # Select payment to edit/delete
-        payment_options = [f"ID: {p['id']} - {p['nama']} ({p['jenis_zakat']})" 
-                          for p in st.session_state.zakat_payments]
+        # Search by name, or pick from the page shown above
+        query = st.text_input("🔍 Cari nama muzakki", key="picker_query",
+                              placeholder="Ketik nama untuk mencari di semua pembayaran")
+        if query.strip():
+            picker_rows = {}
+            for payment_id in store.search(query):
+                payment_data = store.get(payment_id)
+                if payment_data:
+                    picker_rows[payment_id] = payment_data
+            if not picker_rows:
+                st.caption("Tidak ada pembayaran dengan nama tersebut")
+        else:
+            picker_rows = {int(payment_id): {'nama': nama, 'jenis_zakat': jenis}
+                           for payment_id, nama, jenis in zip(df['id'], df['nama'], df['jenis_zakat'])}
+        
+        def payment_label(payment_id):
+            if payment_id is None:
+                return "Pilih pembayaran..."
+            row = picker_rows[payment_id]
+            return f"ID: {payment_id} - {row['nama']} ({row['jenis_zakat']})"
         
-        if payment_options:
-            selected_payment = st.selectbox(
+        if picker_rows:
+            payment_id = st.selectbox(
                 "Pilih pembayaran untuk diedit atau dihapus:",
-                ["Pilih pembayaran..."] + payment_options
+                [None] + list(picker_rows),
+                format_func=payment_label
             )
             
-            if selected_payment != "Pilih pembayaran...":
-                payment_id = int(selected_payment.split(":")[1].split(" -")[0])
-                payment_data = next((p for p in st.session_state.zakat_payments if p['id'] == payment_id), None)
+            if payment_id is not None:
+                payment_data = store.get(payment_id)
                 
                 if payment_data:
                     col1, col2 = st.columns(2)
                     
+                    # Callbacks get the versi shown here, so a change made by another
+                    # session before the click is a conflict rather than overwritten
                     with col1:
-                        if st.button("✏️ Edit Pembayaran", use_container_width=True):
-                            st.session_state.edit_payment_id = payment_id
-                            st.rerun()
+                        st.button("✏️ Edit Pembayaran", use_container_width=True,
+                                  on_click=start_edit, args=(payment_data,))
                     
                     with col2:
-                        if st.button("🗑️ Hapus Pembayaran", use_container_width=True):
-                            delete_payment(payment_id)
-                            st.success(f"✅ Pembayaran ID {payment_id} berhasil dihapus")
-                            st.rerun()
+                        st.button("🗑️ Hapus Pembayaran", use_container_width=True,
+                                  on_click=delete_payment, args=(payment_id, payment_data['versi']))
         
-        # Edit form
-        if hasattr(st.session_state, 'edit_payment_id'):
-            edit_id = st.session_state.edit_payment_id
-            edit_data = next((p for p in st.session_state.zakat_payments if p['id'] == edit_id), None)
+        # Edit form, on the payment as it was when editing started
+        if 'edit_payment' in st.session_state:
+            edit_data = st.session_state.edit_payment
+            edit_id = edit_data['id']
+            current = store.get(edit_id)
+            
+            st.markdown("---")
+            st.subheader(f"✏️ Edit Pembayaran ID: {edit_id}")
             
-            if edit_data:
-                st.markdown("---")
-                st.subheader(f"✏️ Edit Pembayaran ID: {edit_id}")
+            if current is None:
+                st.warning(f"⚠️ Pembayaran ID {edit_id} sudah dihapus oleh pengguna lain.")
+                if st.button("❌ Tutup"):
+                    del st.session_state.edit_payment
+                    st.rerun()
+            else:
+                if current['versi'] != edit_data['versi']:
+                    st.warning("⚠️ Pembayaran ini diubah oleh pengguna lain sejak Anda membukanya. "
+                               "Muat data terbaru sebelum menyimpan perubahan.")
+                    if st.button("🔄 Muat Data Terbaru"):
+                        st.session_state.edit_payment = current
+                        st.rerun()
                 
                 with st.form(f"edit_form_{edit_id}"):
                     col1, col2 = st.columns(2)
@@ -874,18 +771,134 @@ def show_payment_history():
                                 'kembalian': edit_kembalian,
                                 'tanggal_bayar': edit_tanggal.strftime('%Y-%m-%d')
                             }
-                            update_payment(edit_id, updated_data)
-                            del st.session_state.edit_payment_id
-                            st.success("✅ Pembayaran berhasil diperbarui!")
-                            st.rerun()
+                            try:
+                                update_payment(edit_id, updated_data, edit_data['versi'])
+                            except VersionConflict as conflict:
+                                st.error(conflict_message(conflict))
+                            else:
+                                del st.session_state.edit_payment
+                                st.session_state.payment_notice = ('success', "✅ Pembayaran berhasil diperbarui!")
+                                st.rerun()
                     
                     with col2:
                         if st.form_submit_button("❌ Batal", use_container_width=True):
-                            del st.session_state.edit_payment_id
+                            del st.session_state.edit_payment
                             st.rerun()
+    elif transaction_count:
+        st.info("🔎 Tidak ada pembayaran yang sesuai dengan filter.")
     else:
         st.info("🌙 Belum ada riwayat pembayaran zakat. Silakan tambahkan pembayaran pertama melalui menu 'Tambah Pembayaran'.")
 
+@timed('show_payment_import')
+def show_payment_import():
+    """Bulk import of payments collected offline, from an Excel or CSV file"""
+    with st.expander("📥 Import Pembayaran dari Excel/CSV"):
+        st.caption("Kolom wajib: Nama, Jenis Zakat, Metode Pembayaran, Total Bayar, Nominal Dibayar. "
+                   "Kolom opsional: Jumlah Jiwa, Tanggal Bayar. Kembalian dihitung otomatis.")
+        price_history = get_rice_price_history()
+        acuan = ["Harga acuan sesuai tanggal bayar"] if price_history else []
+        harga_fitrah = st.selectbox(
+            "Harga beras untuk Zakat Fitrah tanpa Total Bayar",
+            [None] + acuan + st.session_state.rice_prices.tiers(),
+            format_func=lambda harga: "Tidak dihitung" if harga is None else (
+                harga if isinstance(harga, str) else format_currency(harga)),
+            key="import_fitrah_harga"
+        )
+        uploaded = st.file_uploader("Pilih file", type=["xlsx", "csv"], key="import_file")
+        if uploaded is None:
+            return
+        
+        if st.session_state.get('imported_file_id') == uploaded.file_id:
+            st.success(f"✅ {st.session_state.imported_count} pembayaran dari {uploaded.name} berhasil diimpor")
+            return
+        
+        try:
+            with section('validate'):
+                if isinstance(harga_fitrah, str):
+                    prices = {'price_history': price_history}
+                else:
+                    prices = {'harga_per_kg': harga_fitrah}
+                valid, errors = validate_payments(read_import_file(uploaded.name, uploaded.getvalue()), **prices)
+        except Exception as e:
+            st.error(f"❌ File tidak dapat dibaca: {e}")
+            return
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Baris Valid", len(valid))
+        with col2:
+            st.metric("Baris Bermasalah", len(errors))
+        
+        if len(errors):
+            st.warning("⚠️ Baris berikut tidak akan diimpor:")
+            st.dataframe(errors, use_container_width=True, hide_index=True)
+        
+        if len(valid) and st.button(f"💾 Impor {len(valid)} Pembayaran Valid", type="primary"):
+            ids = import_payments(valid)
+            st.session_state.imported_file_id = uploaded.file_id
+            st.session_state.imported_count = len(ids)
+            st.rerun()
+
+# Report dimensions: column in the rollup cube -> label
+REPORT_DIMENSIONS = {
+    'tanggal_bayar': "Tanggal Bayar",
+    'jenis_zakat': "Jenis Zakat",
+    'metode_pembayaran': "Metode Pembayaran",
+}
+
+@timed('show_rollup_report')
+def show_rollup_report():
+    """Totals per tanggal bayar, jenis zakat and metode, read from the store's rollup cube only"""
+    st.title("📈 Laporan Ringkasan Zakat")
+    
+    store = get_payment_store()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        date_range = st.date_input("📅 Tanggal Bayar (rentang)", value=(), key="report_dates")
+    with col2:
+        jenis_filter = st.multiselect("Jenis Zakat", get_zakat_types(), key="report_jenis")
+    with col3:
+        metode_filter = st.multiselect("Metode Pembayaran", get_payment_methods(), key="report_metode")
+    filters = PaymentFilter(
+        date_from=date_range[0].strftime("%Y-%m-%d") if date_range else None,
+        date_to=date_range[-1].strftime("%Y-%m-%d") if date_range else None,
+        jenis_zakat=tuple(jenis_filter),
+        metode_pembayaran=tuple(metode_filter)
+    )
+    
+    with section('data'):
+        cells = store.rollup(filters)
+    if not cells:
+        st.info("🔎 Tidak ada pembayaran yang sesuai dengan filter.")
+        return
+    
+    import pandas as pd
+
+    cube = pd.DataFrame(cells, columns=list(REPORT_DIMENSIONS) + ['count', 'total_bayar', 'jumlah_jiwa'])
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("💰 Total Bayar", format_currency(cube['total_bayar'].sum()))
+    with col2:
+        st.metric("📊 Jumlah Transaksi", f"{cube['count'].sum():,}".replace(",", "."))
+    with col3:
+        st.metric("👨‍👩‍👧 Jumlah Jiwa", f"{cube['jumlah_jiwa'].sum():,}".replace(",", "."))
+    
+    group_by = st.multiselect("Kelompokkan menurut", list(REPORT_DIMENSIONS), default=['tanggal_bayar'],
+                              format_func=REPORT_DIMENSIONS.get, key="report_group_by")
+    if group_by:
+        report = cube.groupby(group_by, as_index=False, sort=True)[['count', 'total_bayar', 'jumlah_jiwa']].sum()
+    else:
+        report = cube
+    with section('render'):
+        report = report.assign(total_bayar=format_currency_column(report['total_bayar']))
+        st.dataframe(
+            report.rename(columns={**REPORT_DIMENSIONS, 'count': "Jumlah Transaksi",
+                                   'total_bayar': "Total Bayar", 'jumlah_jiwa': "Jumlah Jiwa"}),
+            use_container_width=True, hide_index=True
+        )
+    st.caption(f"Dihitung dari {len(cells)} sel ringkasan, tanpa membaca setiap pembayaran")
+
+@timed('show_rice_prices')
 def show_rice_prices():
     """Display rice prices management with Islamic theme"""
     st.title("🌾 Data Penerimaan Beras Zakat")
@@ -941,14 +954,16 @@ def show_rice_prices():
     st.subheader("📋 Daftar Harga Beras Saat Ini")
     
     if st.session_state.rice_prices:
-        # Create DataFrame
-        df_rice = pd.DataFrame(st.session_state.rice_prices)
-        df_rice['harga_formatted'] = df_rice['harga'].apply(format_currency)
+        import pandas as pd
+
+        rice_prices = st.session_state.rice_prices
+        df_rice = pd.DataFrame(list(rice_prices), columns=['id', 'harga'])
+        df_rice['harga_formatted'] = format_currency_column(df_rice['harga'])
         
-        # Calculate statistics
-        avg_price = df_rice['harga'].mean()
-        min_price = df_rice['harga'].min()
-        max_price = df_rice['harga'].max()
+        # Statistics are kept up to date by the registry
+        avg_price = rice_prices.mean
+        min_price = rice_prices.min
+        max_price = rice_prices.max
         
         # Display statistics
         col1, col2, col3 = st.columns(3)
@@ -985,7 +1000,8 @@ def show_rice_prices():
             'harga_formatted': 'Harga per Kg'
         })
         
-        st.dataframe(df_display, use_container_width=True)
+        with section('render'):
+            st.dataframe(df_display, use_container_width=True)
         
         # Delete rice price
         st.markdown("---")
@@ -1020,7 +1036,7 @@ def show_rice_prices():
                         help="Tambah beberapa harga beras standar"):
                 standard_prices = [12000, 15000, 18000, 20000, 25000]
                 for price in standard_prices:
-                    if not any(rp['harga'] == price for rp in st.session_state.rice_prices):
+                    if price not in st.session_state.rice_prices:
                         add_rice_price(price)
                 st.success("✅ Harga beras standar berhasil ditambahkan!")
                 st.rerun()
@@ -1046,7 +1062,7 @@ def show_rice_prices():
         col1, col2 = st.columns(2)
         with col1:
             if st.button("✅ Ya, Hapus Semua Harga", type="primary"):
-                st.session_state.rice_prices = []
+                st.session_state.rice_prices.clear()
                 st.session_state.show_delete_all_rice_confirm = False
                 st.success("✅ Semua data harga beras berhasil dihapus")
                 st.rerun()
@@ -1054,6 +1070,68 @@ def show_rice_prices():
             if st.button("❌ Batal Hapus"):
                 st.session_state.show_delete_all_rice_confirm = False
                 st.rerun()
+    
+    show_rice_price_history()
+
+@timed('show_rice_price_history')
+def show_rice_price_history():
+    """Reference rice prices by effective date, and fitrah payments revalued at them"""
+    history = get_rice_price_history()
+    
+    st.markdown("---")
+    st.subheader("📅 Harga Acuan per Tanggal Berlaku")
+    st.caption("Harga acuan berlaku mulai tanggalnya sampai harga acuan berikutnya.")
+    
+    with st.form("add_rice_price_history"):
+        col1, col2, col3 = st.columns([2, 2, 1])
+        with col1:
+            berlaku = st.date_input("📅 Berlaku Sejak", value=datetime.now().date())
+        with col2:
+            harga_acuan = st.number_input("Harga Acuan per Kg (Rp)", min_value=0.0, format="%.2f", step=500.0)
+        with col3:
+            if st.form_submit_button("💾 Simpan", type="primary", use_container_width=True):
+                if harga_acuan > 0:
+                    get_payment_store().set_rice_price(berlaku.strftime("%Y-%m-%d"), harga_acuan)
+                    st.rerun()
+                else:
+                    st.error("❌ Harga harus lebih dari 0")
+    
+    if not history:
+        st.info("📅 Belum ada harga acuan. Tambahkan harga acuan untuk menilai ulang pembayaran zakat fitrah.")
+        return
+    
+    entries = list(history)
+    st.dataframe(
+        {'Berlaku Sejak': [tanggal for tanggal, _ in entries],
+         'Harga per Kg': [format_currency(harga) for _, harga in entries]},
+        use_container_width=True, hide_index=True
+    )
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        tanggal_hapus = st.selectbox("Pilih harga acuan untuk dihapus:", [None] + [t for t, _ in entries],
+                                     format_func=lambda t: "Pilih tanggal..." if t is None else t)
+    with col2:
+        if tanggal_hapus and st.button("🗑️ Hapus Harga Acuan", use_container_width=True):
+            get_payment_store().remove_rice_price(tanggal_hapus)
+            st.rerun()
+    
+    # Every Zakat Fitrah payment, valued at the price in effect on its tanggal_bayar
+    if st.button("📊 Nilai Ulang Zakat Fitrah"):
+        store = get_payment_store()
+        chunks = store.iter_chunks(['jumlah_jiwa', 'total_bayar', 'tanggal_bayar'],
+                                   filters=PaymentFilter(jenis_zakat=("Zakat Fitrah",)))
+        with section('revalue'):
+            revalued = revalue_fitrah(chunks, history)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Total Tercatat", format_currency(revalued['total_bayar']),
+                      help=f"{revalued['count']} pembayaran zakat fitrah")
+        with col2:
+            st.metric("Nilai pada Harga Acuan", format_currency(revalued['nilai_acuan']))
+        with col3:
+            st.metric("Selisih", format_currency(revalued['selisih']))
+        if revalued['tanpa_harga']:
+            st.warning(f"⚠️ {revalued['tanpa_harga']} pembayaran bertanggal sebelum harga acuan pertama tidak dinilai.")
 
 if __name__ == "__main__":
     main()
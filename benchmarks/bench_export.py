@@ -0,0 +1,132 @@
+"""Export benchmark: DataFrame + ExcelWriter vs the streaming export formats
+
+Seeds a SQLite ledger per size, then runs each export path in a fresh
+subprocess so peak RSS is measured per run.
+
+    python benchmarks/bench_export.py --rows 100000,1000000
+    python benchmarks/bench_export.py --modes CSV,Parquet,Arrow
+"""
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from storage import PAYMENT_COLUMNS, SQLitePaymentStore  # noqa: E402
+
+ZAKAT_TYPES = ["Zakat Fitrah", "Zakat Mal", "Zakat Profesi", "Zakat Emas", "Zakat Perak", "Zakat Perdagangan"]
+PAYMENT_METHODS = ["Tunai", "Transfer Bank", "E-Wallet", "Kartu Kredit"]
+
+
+def seed_ledger(path, rows):
+    """Create a SQLite ledger with synthetic payments"""
+    SQLitePaymentStore(path).close()
+    rng = random.Random(rows)
+    conn = sqlite3.connect(path)
+
+    def generate():
+        for payment_id in range(1, rows + 1):
+            total = rng.choice([35000.0, 45000.0, 50000.0, 135000.0, rng.randrange(10, 5000) * 1000.0])
+            paid = total + rng.choice([0.0, 0.0, 5000.0, 15000.0])
+            yield (payment_id, f"Muzakki {payment_id}", rng.randint(1, 8), rng.choice(ZAKAT_TYPES),
+                   rng.choice(PAYMENT_METHODS), total, paid, paid - total,
+                   f"2026-03-{rng.randint(1, 31):02d}", "2026-03-31 12:00:00", 1)
+
+    with conn:
+        conn.executemany(f"INSERT INTO payments VALUES ({', '.join('?' * len(PAYMENT_COLUMNS))})", generate())
+        conn.execute("UPDATE id_sequence SET last_id = ? WHERE name = 'payments'", (rows,))
+    conn.close()
+
+
+def export_dataframe(store):
+    """The previous export: whole ledger as a DataFrame written through pd.ExcelWriter"""
+    import pandas as pd
+    from exports import EXPORT_COLUMNS, EXPORT_HEADERS, SHEET_NAME
+
+    conn = sqlite3.connect(store.path)
+    try:
+        df = pd.read_sql_query("SELECT * FROM payments ORDER BY id", conn)
+    finally:
+        conn.close()
+    df = df[EXPORT_COLUMNS].rename(columns=EXPORT_HEADERS)
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name=SHEET_NAME)
+    return output.getvalue()
+
+
+def export_streaming(file_format):
+    def export(store):
+        from exports import export_bytes
+        return export_bytes(store, file_format)
+    return export
+
+
+MODES = {
+    'dataframe': export_dataframe,
+    'Excel': export_streaming('Excel'),
+    'CSV': export_streaming('CSV'),
+    'Parquet': export_streaming('Parquet'),
+    'Arrow': export_streaming('Arrow'),
+}
+
+
+def run_child(mode, path):
+    store = SQLitePaymentStore(path)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    data = MODES[mode](store)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'rows': store.count(),
+        'mode': mode,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(store.count() / elapsed),
+        'peak_rss_mb': round(peak_kb / 1024, 1),
+        'export_rss_mb': round((peak_kb - baseline_kb) / 1024, 1),
+        'file_mb': round(len(data) / 1024 / 1024, 2),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='100000,1000000', help='comma separated ledger sizes')
+    parser.add_argument('--modes', default=','.join(MODES), help='comma separated export paths')
+    parser.add_argument('--json', help='also write results to this file')
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'DB'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in (int(n) for n in args.rows.split(',')):
+            path = os.path.join(tmp, f"ledger_{rows}.db")
+            seed_ledger(path, rows)
+            for mode in args.modes.split(','):
+                out = subprocess.run([sys.executable, __file__, '--child', mode, path],
+                                     check=True, capture_output=True, text=True).stdout
+                result = json.loads(out.strip().splitlines()[-1])
+                results.append(result)
+                print(f"{result['rows']:>9} rows  {mode:<10} {result['seconds']:>8.2f} s  "
+                      f"{result['rows_per_second']:>8} rows/s  peak {result['peak_rss_mb']:>7.1f} MB  "
+                      f"(+{result['export_rss_mb']:.1f} MB)  {result['file_mb']:.1f} MB file")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
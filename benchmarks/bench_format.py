@@ -0,0 +1,92 @@
+"""Rupiah formatting benchmark: per-row .apply vs format_currency_column
+
+Formats the three currency columns of a synthetic ledger the way the
+display tables do, once with the previous per-cell path and once with the
+vectorized one, and checks both give identical strings.
+
+    python benchmarks/bench_format.py --rows 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+
+from formatting import format_currency, format_currency_column  # noqa: E402
+
+CURRENCY_COLUMNS = ['total_bayar', 'nominal_dibayar', 'kembalian']
+
+
+def ledger_amounts(rows, distinct):
+    """Currency columns of a synthetic ledger
+
+    Mostly fitrah amounts (jiwa x rice price) unless ``distinct``, which
+    gives every row its own amount as a worst case for the cache.
+    """
+    rng = random.Random(rows)
+    if distinct:
+        total = [rng.randrange(10_000, 50_000_000) + rng.randrange(100) / 100 for _ in range(rows)]
+    else:
+        total = [rng.randint(1, 8) * rng.choice([35000.0, 40000.0, 45000.0]) if rng.random() < 0.9
+                 else rng.randrange(10, 5000) * 1000.0 for _ in range(rows)]
+    paid = [amount + rng.choice([0.0, 0.0, 5000.0, 15000.0]) for amount in total]
+    return pd.DataFrame({'total_bayar': total, 'nominal_dibayar': paid,
+                         'kembalian': [p - t for p, t in zip(paid, total)]})
+
+
+def per_row(df):
+    """The previous path: one uncached format per cell"""
+    return {col: df[col].apply(format_currency.__wrapped__) for col in CURRENCY_COLUMNS}
+
+
+def vectorized(df):
+    format_currency.cache_clear()
+    return {col: format_currency_column(df[col]) for col in CURRENCY_COLUMNS}
+
+
+def timed(fn, df, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(df)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='1000,100000', help='comma separated ledger sizes')
+    parser.add_argument('--repeat', type=int, default=5, help='best of this many runs')
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    results = []
+    for rows in (int(n) for n in args.rows.split(',')):
+        for distinct in (False, True):
+            df = ledger_amounts(rows, distinct)
+            old_seconds, old = timed(per_row, df, args.repeat)
+            new_seconds, new = timed(vectorized, df, args.repeat)
+            assert all(old[col].tolist() == new[col].tolist() for col in CURRENCY_COLUMNS)
+            result = {
+                'rows': rows,
+                'amounts': 'distinct' if distinct else 'fitrah',
+                'per_row_ms': round(old_seconds * 1000, 2),
+                'vectorized_ms': round(new_seconds * 1000, 2),
+                'speedup': round(old_seconds / new_seconds, 1),
+            }
+            results.append(result)
+            print(f"{rows:>9} rows  {result['amounts']:<8}  per-row {result['per_row_ms']:>9.2f} ms  "
+                  f"vectorized {result['vectorized_ms']:>9.2f} ms  x{result['speedup']}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
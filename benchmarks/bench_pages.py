@@ -0,0 +1,182 @@
+"""Page benchmark: rerun latency and peak memory of app.py per page
+
+Drives app.py headlessly with Streamlit's AppTest against seeded SQLite
+ledgers. Each scenario runs in a fresh subprocess on its own copy of the
+ledger, so peak RSS is per scenario and writes don't leak between them.
+
+    python benchmarks/bench_pages.py --rows 1000,10000,100000 --json pages.json
+    python benchmarks/bench_pages.py --compare before.json --json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MENU = {
+    'dashboard': "Dashboard",
+    'tambah_submit': "Tambah Pembayaran",
+    'riwayat': "Riwayat Pembayaran",
+    'riwayat_export': "Riwayat Pembayaran",
+    'beras': "Data Harga Beras",
+}
+
+
+def by_label(widgets, label):
+    return next(widget for widget in widgets if widget.label.startswith(label))
+
+
+def check(at):
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return at
+
+
+def timed_run(at):
+    start = time.perf_counter()
+    check(at.run())
+    return time.perf_counter() - start
+
+
+def rerun(at, i):
+    """A plain rerun of the current page, as after any widget interaction"""
+    return timed_run(at)
+
+
+def submit_payment(at, i):
+    """Fill the Tambah Pembayaran form and submit it; the save reruns the script"""
+    by_label(at.main.text_input, "Nama Lengkap").input(f"Benchmark {i}")
+    by_label(at.main.selectbox, "Jenis Zakat").set_value("Zakat Fitrah")
+    by_label(at.main.selectbox, "Metode Pembayaran").set_value("Tunai")
+    by_label(at.main.number_input, "Total Bayar").set_value(45000.0)
+    by_label(at.main.number_input, "Nominal Dibayar").set_value(50000.0)
+    by_label(at.main.button, "💾 Simpan Pembayaran").click()
+    elapsed = timed_run(at)
+    if at.error:
+        raise RuntimeError(at.error[0].value)
+    return elapsed
+
+
+def prepare_export(at, i):
+    """Click Export and wait for the rerun that builds the file"""
+    by_label(at.main.button, "📊 Export").click()
+    elapsed = timed_run(at)
+    if not at.get('download_button'):
+        raise RuntimeError("export did not produce a download button")
+    return elapsed
+
+
+STEPS = {
+    'dashboard': rerun,
+    'tambah_submit': submit_payment,
+    'riwayat': rerun,
+    'riwayat_export': prepare_export,
+    'beras': rerun,
+}
+
+
+def run_child(scenario, path, repeat, export_format):
+    from streamlit.testing.v1 import AppTest
+
+    os.environ['ZAKAT_STORAGE'] = 'sqlite'
+    os.environ['ZAKAT_DB_PATH'] = path
+    at = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=600)
+    first_seconds = timed_run(at)
+    if MENU[scenario] != "Dashboard":
+        at.sidebar.selectbox[0].set_value(MENU[scenario])
+        first_seconds = timed_run(at)
+    if scenario == 'riwayat_export':
+        check(by_label(at.main.selectbox, "Format Export").set_value(export_format).run())
+        # The export is cached per ledger version, so only the first one builds a file
+        repeat = 1
+
+    seconds = [STEPS[scenario](at, i) for i in range(repeat)]
+    print(json.dumps({
+        'first_ms': round(first_seconds * 1000, 1),
+        'median_ms': round(statistics.median(seconds) * 1000, 1),
+        'best_ms': round(min(seconds) * 1000, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(base, results):
+    """Print each result's median against the same scenario and size in a previous run"""
+    previous = {(r['scenario'], r['rows']): r for r in base['results']}
+    print(f"\nvs {base.get('commit') or 'base'}")
+    for result in results:
+        old = previous.get((result['scenario'], result['rows']))
+        if old:
+            print(f"{result['rows']:>7} rows  {result['scenario']:<15} median {old['median_ms']:>9.1f} -> "
+                  f"{result['median_ms']:>9.1f} ms  x{old['median_ms'] / result['median_ms']:.2f}  "
+                  f"peak {old['peak_rss_mb']:>6.1f} -> {result['peak_rss_mb']:>6.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='1000,10000,100000', help='comma separated ledger sizes')
+    parser.add_argument('--scenarios', default=','.join(STEPS), help='comma separated scenarios')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per scenario')
+    parser.add_argument('--export-format', default='Excel', help='format for the riwayat_export scenario')
+    parser.add_argument('--json', help='also write results to this file')
+    parser.add_argument('--compare', help='results file of an earlier run to compare against')
+    parser.add_argument('--child', nargs=2, metavar=('SCENARIO', 'DB'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child, args.repeat, args.export_format)
+        return
+
+    from bench_export import seed_ledger
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in (int(n) for n in args.rows.split(',')):
+            seeded = os.path.join(tmp, f"ledger_{rows}.db")
+            seed_ledger(seeded, rows)
+            for scenario in args.scenarios.split(','):
+                path = os.path.join(tmp, 'run.db')
+                shutil.copyfile(seeded, path)
+                out = subprocess.run([sys.executable, __file__, '--child', scenario, path,
+                                      '--repeat', str(args.repeat), '--export-format', args.export_format],
+                                     check=True, capture_output=True, text=True).stdout
+                result = {'scenario': scenario, 'rows': rows, **json.loads(out.strip().splitlines()[-1])}
+                results.append(result)
+                print(f"{rows:>7} rows  {scenario:<15} first {result['first_ms']:>9.1f} ms  "
+                      f"median {result['median_ms']:>9.1f} ms  best {result['best_ms']:>9.1f} ms  "
+                      f"peak {result['peak_rss_mb']:>6.1f} MB")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    if args.json:
+        import streamlit
+
+        with open(args.json, 'w') as f:
+            json.dump({
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'streamlit': streamlit.__version__,
+                'repeat': args.repeat,
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
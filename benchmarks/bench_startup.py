@@ -0,0 +1,102 @@
+"""Cold start benchmark: import time and first dashboard run of app.py
+
+Each measurement runs in a fresh interpreter, as an autoscale instance
+would. ``imports`` parses ``python -X importtime`` for the modules app.py
+imports; ``first_run`` times the first script run of app.py (the
+dashboard) against a new ledger of the given size.
+
+    python benchmarks/bench_startup.py --rows 0,1000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+APP_IMPORTS = "import streamlit, streamlit.components.v1, exports, formatting, imports, ledger, storage"
+HEAVY_MODULES = ['numpy', 'pandas', 'pyarrow', 'openpyxl']
+
+
+def import_times(stderr):
+    """Cumulative import time in ms per module from -X importtime output, and which were top-level"""
+    times, top_level = {}, []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative) / 1000
+        if not name.startswith('  '):
+            top_level.append(name.strip())
+    return times, top_level
+
+
+def measure_imports():
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', APP_IMPORTS],
+                         cwd=ROOT, check=True, capture_output=True, text=True)
+    times, top_level = import_times(out.stderr)
+    return {
+        'total_ms': round(sum(times[name] for name in top_level), 1),
+        'heavy_ms': {name: round(times[name], 1) for name in HEAVY_MODULES if name in times},
+    }
+
+
+def run_child(path):
+    from streamlit.testing.v1 import AppTest
+
+    os.environ['ZAKAT_DB_PATH'] = path
+    start = time.perf_counter()
+    at = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=120).run()
+    elapsed = time.perf_counter() - start
+    assert not at.exception, at.exception
+    print(json.dumps({
+        'seconds': round(elapsed, 3),
+        'loaded': [name for name in HEAVY_MODULES if name in sys.modules],
+    }))
+
+
+def measure_first_run(path):
+    out = subprocess.run([sys.executable, __file__, '--child', path],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='0,1000', help='comma separated ledger sizes for the first run')
+    parser.add_argument('--repeat', type=int, default=5, help='best of this many runs')
+    parser.add_argument('--json', help='also write results to this file')
+    parser.add_argument('--child', metavar='DB', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    imports = min((measure_imports() for _ in range(args.repeat)), key=lambda r: r['total_ms'])
+    results = [{'mode': 'imports', **imports}]
+    print(f"imports    {imports['total_ms']:>8.1f} ms  heavy: "
+          + (', '.join(f"{name} {ms:.1f} ms" for name, ms in imports['heavy_ms'].items()) or 'none'))
+
+    # Only the parent seeds ledgers, so the child starts without any app module imported
+    from bench_export import seed_ledger
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in (int(n) for n in args.rows.split(',')):
+            path = os.path.join(tmp, f"ledger_{rows}.db")
+            seed_ledger(path, rows)
+            run = min((measure_first_run(path) for _ in range(args.repeat)), key=lambda r: r['seconds'])
+            results.append({'mode': 'first_run', 'rows': rows, **run})
+            print(f"first run  {run['seconds'] * 1000:>8.1f} ms  {rows:>7} rows  loaded: "
+                  f"{', '.join(run['loaded']) or 'none'}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
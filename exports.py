@@ -0,0 +1,149 @@
+import csv
+import io
+import tempfile
+
+# Column order and Indonesian headers shared by every export format
+EXPORT_COLUMNS = ['id', 'nama', 'jumlah_jiwa', 'jenis_zakat', 'metode_pembayaran',
+                  'total_bayar', 'nominal_dibayar', 'kembalian', 'tanggal_bayar', 'tanggal_input']
+
+EXPORT_HEADERS = {
+    'id': 'ID',
+    'nama': 'Nama',
+    'jumlah_jiwa': 'Jumlah Jiwa',
+    'jenis_zakat': 'Jenis Zakat',
+    'metode_pembayaran': 'Metode Pembayaran',
+    'total_bayar': 'Total Bayar',
+    'nominal_dibayar': 'Nominal Dibayar',
+    'kembalian': 'Kembalian',
+    'tanggal_bayar': 'Tanggal Bayar',
+    'tanggal_input': 'Tanggal Input'
+}
+
+SHEET_NAME = 'Pembayaran Zakat'
+# Rows per worksheet, header included (Excel's hard limit)
+EXCEL_MAX_ROWS = 1048576
+
+
+def write_excel(chunks, output):
+    """Stream row chunks into an .xlsx workbook
+
+    Uses openpyxl's write-only mode, which spools each worksheet to a
+    temporary file instead of building cell objects in memory, so peak
+    memory is one chunk of rows no matter how large the ledger is. Ledgers
+    longer than Excel's row limit continue on extra sheets.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font
+
+    workbook = Workbook(write_only=True)
+    header_font = Font(bold=True)
+    header_alignment = Alignment(horizontal='center')
+
+    def new_sheet():
+        sheet = workbook.create_sheet(SHEET_NAME if not workbook.worksheets
+                                      else f"{SHEET_NAME} ({len(workbook.worksheets) + 1})")
+        header = []
+        for col in EXPORT_COLUMNS:
+            cell = WriteOnlyCell(sheet, value=EXPORT_HEADERS[col])
+            cell.font = header_font
+            cell.alignment = header_alignment
+            header.append(cell)
+        sheet.append(header)
+        return sheet
+
+    sheet = new_sheet()
+    rows_in_sheet = 1
+    for chunk in chunks:
+        for row in chunk:
+            if rows_in_sheet == EXCEL_MAX_ROWS:
+                sheet = new_sheet()
+                rows_in_sheet = 1
+            sheet.append(row)
+            rows_in_sheet += 1
+    workbook.save(output)
+
+
+def write_csv(chunks, output):
+    """Stream row chunks into a UTF-8 CSV file"""
+    text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_HEADERS[col] for col in EXPORT_COLUMNS)
+    for chunk in chunks:
+        writer.writerows(chunk)
+    text.flush()
+    text.detach()
+
+
+def _arrow_schema():
+    import pyarrow as pa
+
+    types = {
+        'id': pa.int64(),
+        'jumlah_jiwa': pa.int64(),
+        'total_bayar': pa.float64(),
+        'nominal_dibayar': pa.float64(),
+        'kembalian': pa.float64(),
+        'tanggal_bayar': pa.date32(),
+        'tanggal_input': pa.timestamp('s'),
+    }
+    return pa.schema([(EXPORT_HEADERS[col], types.get(col, pa.string())) for col in EXPORT_COLUMNS])
+
+
+def _arrow_batches(chunks, schema):
+    """Turn row chunks into record batches matching the export schema"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        arrays = []
+        for field, values in zip(schema, zip(*chunk)):
+            if pa.types.is_date(field.type):
+                array = pc.strptime(pa.array(values, pa.string()), format='%Y-%m-%d', unit='s').cast(field.type)
+            elif pa.types.is_timestamp(field.type):
+                array = pc.strptime(pa.array(values, pa.string()), format='%Y-%m-%d %H:%M:%S', unit='s')
+            else:
+                array = pa.array(values, field.type)
+            arrays.append(array)
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_parquet(chunks, output):
+    """Stream row chunks into a Parquet file, one row group per chunk"""
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema()
+    with pq.ParquetWriter(output, schema) as writer:
+        for batch in _arrow_batches(chunks, schema):
+            writer.write_batch(batch)
+
+
+def write_arrow(chunks, output):
+    """Stream row chunks into an Arrow IPC (Feather v2) file"""
+    import pyarrow as pa
+
+    schema = _arrow_schema()
+    with pa.ipc.new_file(output, schema) as writer:
+        for batch in _arrow_batches(chunks, schema):
+            writer.write_batch(batch)
+
+
+# format -> (file extension, MIME type, writer)
+EXPORT_FORMATS = {
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', write_excel),
+    'CSV': ('csv', 'text/csv', write_csv),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet', write_parquet),
+    'Arrow': ('arrow', 'application/vnd.apache.arrow.file', write_arrow),
+}
+
+
+def export_bytes(store, file_format, filters=None, chunk_size=5000):
+    """Export the store's payments, or those matching a PaymentFilter, in one of EXPORT_FORMATS"""
+    writer = EXPORT_FORMATS[file_format][2]
+    with tempfile.TemporaryFile() as output:
+        writer(store.iter_chunks(EXPORT_COLUMNS, chunk_size, filters), output)
+        output.seek(0)
+        return output.read()
+
@@ -0,0 +1,27 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=8192)
+def format_currency(amount):
+    """Format number as Indonesian Rupiah"""
+    return f"Rp {amount:,.2f}".replace(",", ".")
+
+
+def format_currency_column(values):
+    """Format a whole column as Indonesian Rupiah
+
+    Each distinct amount is formatted once (and remembered across calls by
+    format_currency's cache), then the labels are spread back over the rows
+    with a single take, so a column of repeated fitrah amounts costs a
+    handful of string formats instead of one per row.
+    """
+    import pandas as pd
+
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values)
+    if not len(uniques):
+        return pd.Series("", index=values.index, dtype=object)
+    labels = pd.Series(list(map(format_currency, uniques.tolist())), dtype=object)
+    formatted = labels.take(codes.clip(min=0)).set_axis(values.index)
+    # factorize gives missing values code -1
+    return formatted.where(codes >= 0, "")
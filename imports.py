@@ -0,0 +1,161 @@
+import io
+import math
+from datetime import datetime
+
+from exports import EXPORT_HEADERS
+from rice import fitrah_due
+from storage import EDITABLE_COLUMNS
+
+ZAKAT_TYPES = ["Zakat Fitrah", "Zakat Mal", "Zakat Profesi", "Zakat Emas", "Zakat Perak", "Zakat Perdagangan"]
+PAYMENT_METHODS = ["Tunai", "Transfer Bank", "E-Wallet", "Kartu Kredit"]
+
+# Import files may use the export headers or the raw column names
+IMPORT_COLUMNS = {header.lower(): col for col, header in EXPORT_HEADERS.items()}
+IMPORT_COLUMNS.update({col: col for col in EXPORT_HEADERS})
+REQUIRED_COLUMNS = ['nama', 'jenis_zakat', 'metode_pembayaran', 'total_bayar', 'nominal_dibayar']
+
+
+def read_import_file(name, data):
+    """Read an uploaded .csv/.xlsx file into a DataFrame of raw cell values"""
+    import pandas as pd
+
+    if name.lower().endswith('.csv'):
+        return pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False)
+    return pd.read_excel(io.BytesIO(data), engine='openpyxl')
+
+
+def parse_dates(values):
+    """Dates as a datetime Series, NaT where a value is not a date
+
+    Each value is parsed on its own against fixed formats, never a format
+    inferred from other rows: ISO 'YYYY-MM-DD' (a time part, as in Excel
+    date cells, is ignored), then day-first 'DD/MM/YYYY' as dates are
+    written in Indonesia.
+    """
+    import pandas as pd
+
+    text = pd.Series(values).astype(str).str.strip()
+    iso = text.str.extract(r'^(\d{4}-\d{2}-\d{2})(?:[T ][\d:.]*)?$', expand=False)
+    day_first = text.str.extract(r'^(\d{1,2}/\d{1,2}/\d{4})$', expand=False)
+    return pd.to_datetime(iso, format='%Y-%m-%d', errors='coerce').fillna(
+        pd.to_datetime(day_first, format='%d/%m/%Y', errors='coerce'))
+
+
+def payment_errors(payment):
+    """Error messages for one payment, empty if it is valid
+
+    These are the payment form's rules, and imports and the ingest API
+    apply them to every row. Values come already parsed: numbers (NaN
+    where a cell was not a number) and tanggal_bayar as 'YYYY-MM-DD'
+    text, None where it was not a date. Plain Python, so the form can
+    check a payment without loading pandas.
+    """
+    def number(field):
+        try:
+            return float(payment[field])
+        except (TypeError, ValueError):
+            return math.nan
+
+    jumlah_jiwa, total_bayar, nominal_dibayar = number('jumlah_jiwa'), number('total_bayar'), number('nominal_dibayar')
+    checks = [
+        (not payment['nama'], "Nama harus diisi"),
+        (not (jumlah_jiwa >= 1) or jumlah_jiwa % 1 != 0, "Jumlah jiwa tidak valid"),
+        (not payment['jenis_zakat'], "Jenis zakat harus diisi"),
+        (payment['jenis_zakat'] and payment['jenis_zakat'] not in ZAKAT_TYPES, "Jenis zakat tidak valid"),
+        (not payment['metode_pembayaran'], "Metode pembayaran harus diisi"),
+        (payment['metode_pembayaran'] and payment['metode_pembayaran'] not in PAYMENT_METHODS,
+         "Metode pembayaran tidak valid"),
+        (not (total_bayar > 0), "Total bayar harus lebih dari 0"),
+        (not (nominal_dibayar > 0), "Nominal dibayar harus lebih dari 0"),
+        # 'inf' and '1e400' read as infinity
+        (math.isinf(total_bayar), "Total bayar tidak valid"),
+        (math.isinf(nominal_dibayar), "Nominal dibayar tidak valid"),
+        (nominal_dibayar < total_bayar, "Nominal dibayar tidak boleh kurang dari total bayar"),
+        (not isinstance(payment['tanggal_bayar'], str), "Tanggal bayar tidak valid"),
+    ]
+    return [message for failed, message in checks if failed]
+
+
+def check_payments(raw, today=None, harga_per_kg=None, price_history=None):
+    """Check raw payment values with the payment form's rules (see payment_errors)
+
+    ``raw`` has a row per payment and columns named like the store's or
+    the export headers. Returns the payments parsed into store columns
+    (kembalian not yet derived) and the error messages of each row joined
+    with '; ', empty for valid rows. Values are parsed a column at a time.
+    With a rice price ``harga_per_kg``, or a RicePriceHistory to take each
+    row's price as of its tanggal_bayar, Zakat Fitrah rows with a blank
+    Total Bayar are priced from their jumlah_jiwa.
+    """
+    import pandas as pd
+
+    raw = raw.rename(columns=lambda col: IMPORT_COLUMNS.get(str(col).strip().lower(), col))
+    missing = [EXPORT_HEADERS[col] for col in REQUIRED_COLUMNS if col not in raw.columns]
+    if missing:
+        raise ValueError(f"Kolom tidak ditemukan: {', '.join(missing)}")
+
+    def text(col):
+        return raw[col].fillna('').astype(str).str.strip()
+
+    def number(col):
+        return pd.to_numeric(raw[col], errors='coerce')
+
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    payments = pd.DataFrame({
+        'nama': text('nama'),
+        'jenis_zakat': text('jenis_zakat'),
+        'metode_pembayaran': text('metode_pembayaran'),
+        'total_bayar': number('total_bayar'),
+        'nominal_dibayar': number('nominal_dibayar'),
+    }, index=raw.index)
+    if 'jumlah_jiwa' in raw.columns:
+        # A blank cell means one person, as in the form
+        payments['jumlah_jiwa'] = number('jumlah_jiwa').mask(text('jumlah_jiwa') == '', 1)
+    else:
+        payments['jumlah_jiwa'] = 1
+    if 'tanggal_bayar' in raw.columns:
+        dates = raw['tanggal_bayar'].where(raw['tanggal_bayar'].astype(str).str.strip() != '')
+        parsed = parse_dates(dates)
+        bad_date = dates.notna() & parsed.isna()
+        payments['tanggal_bayar'] = parsed.dt.strftime("%Y-%m-%d").fillna(today)
+    else:
+        bad_date = pd.Series(False, index=raw.index)
+        payments['tanggal_bayar'] = today
+    if price_history is not None:
+        harga_per_kg = price_history.as_of_many(payments['tanggal_bayar'])
+    if harga_per_kg is not None:
+        fitrah = payments['total_bayar'].isna() & (payments['jenis_zakat'] == 'Zakat Fitrah')
+        payments['total_bayar'] = payments['total_bayar'].mask(
+            fitrah, fitrah_due(payments['jumlah_jiwa'], harga_per_kg))
+
+    dates = payments['tanggal_bayar'].astype(object).mask(bad_date, None)
+    messages = ['; '.join(payment_errors(payment)) for payment in payments.assign(tanggal_bayar=dates).to_dict('records')]
+    return payments, pd.Series(messages, index=raw.index)
+
+
+def valid_payments(payments, invalid):
+    """The rows of checked payments not marked ``invalid``, typed and in store columns"""
+    valid = payments[~invalid].astype({
+        'jumlah_jiwa': 'int64', 'total_bayar': 'float64', 'nominal_dibayar': 'float64'})
+    valid['kembalian'] = valid['nominal_dibayar'] - valid['total_bayar']
+    return valid[EDITABLE_COLUMNS]
+
+
+def validate_payments(raw, today=None, harga_per_kg=None, price_history=None):
+    """Check an import file with the payment form's rules (see check_payments)
+
+    Returns the valid payments as a DataFrame in store columns (kembalian
+    derived, tanggal_input left to the caller) and the rejected rows as a
+    DataFrame of file row numbers and error messages.
+    """
+    import pandas as pd
+
+    raw = raw.reset_index(drop=True)
+    payments, messages = check_payments(raw, today, harga_per_kg, price_history)
+    invalid = messages != ''
+    errors = pd.DataFrame({
+        # Header is row 1 of the file
+        'Baris': raw.index[invalid.to_numpy()] + 2,
+        'Kesalahan': messages[invalid].to_numpy(),
+    })
+    return valid_payments(payments, invalid), errors
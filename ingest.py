@@ -0,0 +1,244 @@
+"""HTTP/JSON ingest of payments from cashier devices, alongside the Streamlit app
+
+    ZAKAT_DB_PATH=zakat.db python ingest.py --host 0.0.0.0 --port 8600
+
+POST /payments takes one payment object, or {"payments": [...]} for a
+batch. Fields are the store's column names (nama, jumlah_jiwa,
+jenis_zakat, metode_pembayaran, total_bayar, nominal_dibayar,
+tanggal_bayar) plus an "idempotency_key" per payment; a single payment may
+send the key as an Idempotency-Key header instead. Payments are checked
+with the payment form's rules and the valid ones of a request are added
+to the app's SQLite ledger in one transaction together with their keys,
+so a device that retries after a timeout never adds a payment twice. The
+response lists, per payment, its id and whether it was created or a
+duplicate, or why it was rejected. GET /health reports the ledger size.
+
+With ZAKAT_INGEST_TOKEN set, requests must send it as
+``Authorization: Bearer <token>``.
+"""
+import argparse
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from imports import REQUIRED_COLUMNS, check_payments, valid_payments
+from storage import open_payment_store
+
+_logger = logging.getLogger("zakat.ingest")
+
+INGEST_TOKEN = os.environ.get("ZAKAT_INGEST_TOKEN")
+# Larger requests are refused without reading them
+MAX_BODY_BYTES = 10 * 1024 * 1024
+MAX_BATCH = 5000
+
+
+class IngestError(Exception):
+    """A request that is refused as a whole, with its HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_payments(body, idempotency_key=None):
+    """Payment dicts from a request body, a single payment or a batch"""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise IngestError(400, "Body harus berupa JSON") from None
+    payments = data.get('payments') if isinstance(data, dict) and 'payments' in data else [data]
+    if not isinstance(payments, list) or not all(isinstance(payment, dict) for payment in payments):
+        raise IngestError(400, "Pembayaran harus berupa objek JSON")
+    if not payments:
+        raise IngestError(400, "Tidak ada pembayaran")
+    if len(payments) > MAX_BATCH:
+        raise IngestError(413, f"Maksimal {MAX_BATCH} pembayaran per permintaan")
+    if idempotency_key and len(payments) == 1:
+        payments[0].setdefault('idempotency_key', idempotency_key)
+    return payments
+
+
+def ingest(store, payments, today=None):
+    """Check payments and add the valid ones to the store; returns a result dict per payment"""
+    import pandas as pd
+
+    keys = [str(payment.get('idempotency_key') or '').strip() for payment in payments]
+    raw = pd.DataFrame.from_records(payments).drop(columns='idempotency_key', errors='ignore')
+    # A field no payment sent is a missing value in every row, not a malformed request
+    raw = raw.reindex(columns=list(raw.columns) + [col for col in REQUIRED_COLUMNS if col not in raw.columns])
+    checked, messages = check_payments(raw, today)
+    messages = messages.tolist()
+    for i, key in enumerate(keys):
+        if not key:
+            messages[i] = '; '.join(filter(None, [messages[i], "Idempotency key harus diisi"]))
+    invalid = pd.Series([bool(message) for message in messages], index=checked.index)
+
+    valid = valid_payments(checked, invalid)
+    records = valid.assign(tanggal_input=datetime.now().strftime("%Y-%m-%d %H:%M:%S")).to_dict('records')
+    stored = iter(store.add_once([keys[i] for i in valid.index], records) if records else [])
+
+    results = []
+    for key, message in zip(keys, messages):
+        if message:
+            results.append({'idempotency_key': key or None, 'status': 'invalid', 'errors': message.split('; ')})
+        else:
+            payment_id, created = next(stored)
+            results.append({'idempotency_key': key, 'id': payment_id,
+                            'status': 'created' if created else 'duplicate'})
+    return results
+
+
+class IngestBatcher:
+    """Runs the payments of concurrent requests through one check and one transaction
+
+    Checking payments costs about the same for one row as for a thousand,
+    so requests are grouped like the journal's group commit: a request
+    that finds no batch in progress leads one, waits ``max_delay`` seconds
+    for others to join, ingests everything gathered and hands each request
+    its share of the results, while the others just wait for theirs. If
+    the shared batch fails, each request is retried on its own, so only the
+    one at fault gets the error.
+    """
+
+    def __init__(self, store, max_delay=0.005):
+        self.store = store
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._leading = False
+
+    def submit(self, payments):
+        """Ingest payments together with whatever other requests are waiting; returns their results"""
+        request = {'payments': payments}
+        with self._cond:
+            self._waiting.append(request)
+            while 'results' not in request:
+                if not self._leading:
+                    self._leading = True
+                    break
+                self._cond.wait()
+            else:
+                return self._outcome(request)
+        try:
+            time.sleep(self.max_delay)
+            with self._cond:
+                batch, self._waiting = self._waiting, []
+            try:
+                results = ingest(self.store, [payment for queued in batch for payment in queued['payments']])
+            except Exception as error:
+                results = error
+            start = 0
+            for queued in batch:
+                end = start + len(queued['payments'])
+                if not isinstance(results, Exception):
+                    queued['results'] = results[start:end]
+                elif len(batch) == 1:
+                    queued['results'] = results
+                else:
+                    # One request broke the shared batch; rerun each alone so only it fails
+                    queued['results'] = self._ingest_alone(queued['payments'])
+                start = end
+        finally:
+            with self._cond:
+                self._leading = False
+                self._cond.notify_all()
+        return self._outcome(request)
+
+    def _ingest_alone(self, payments):
+        """Results of ingesting one request by itself, or the error it raised"""
+        try:
+            return ingest(self.store, payments)
+        except Exception as error:
+            return error
+
+    @staticmethod
+    def _outcome(request):
+        if isinstance(request['results'], Exception):
+            raise request['results']
+        return request['results']
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so a device posting payment after payment reuses its connection
+    protocol_version = "HTTP/1.1"
+    server_version = "ZakatIngest/1"
+    # Headers and body go out in separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        if not INGEST_TOKEN:
+            return True
+        return hmac.compare_digest(self.headers.get('Authorization', ''), f"Bearer {INGEST_TOKEN}")
+
+    def do_GET(self):
+        if self.path != '/health':
+            return self._reply(404, {'error': "Not found"})
+        self._reply(200, {'status': 'ok', 'count': self.server.store.count()})
+
+    def do_POST(self):
+        # Refused requests leave their body unread, and on a kept-alive
+        # connection it would be taken for the start of the next request
+        if self.path != '/payments':
+            self.close_connection = True
+            return self._reply(404, {'error': "Not found"})
+        if not self._authorized():
+            self.close_connection = True
+            return self._reply(401, {'error': "Unauthorized"})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if not 0 <= length <= MAX_BODY_BYTES:
+            self.close_connection = True
+            return self._reply(413 if length > 0 else 400, {'error': "Content-Length tidak valid"})
+        try:
+            payments = parse_payments(self.rfile.read(length), self.headers.get('Idempotency-Key'))
+            results = self.server.batcher.submit(payments)
+        except IngestError as error:
+            return self._reply(error.status, {'error': str(error)})
+        except Exception:
+            _logger.exception("Ingest request failed")
+            return self._reply(500, {'error': "Internal server error"})
+        self._reply(200, {'results': results})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8600, help='port to listen on')
+    args = parser.parse_args()
+
+    # Only SQLite can be written by this process and the app at the same time
+    if os.environ.get("ZAKAT_STORAGE", "sqlite") != "sqlite":
+        parser.error("ingest needs ZAKAT_STORAGE=sqlite; a journal directory belongs to a single process")
+
+    server = ThreadingHTTPServer((args.host, args.port), IngestHandler)
+    server.store = open_payment_store()
+    server.batcher = IngestBatcher(server.store)
+    print(f"Ingest listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,468 @@
+import bisect
+import heapq
+from array import array
+from collections import namedtuple
+
+# Typecodes for the numeric columns: 'q' int64, 'd' float64
+NUMERIC_COLUMNS = {
+    'id': 'q',
+    'jumlah_jiwa': 'q',
+    'total_bayar': 'd',
+    'nominal_dibayar': 'd',
+    'kembalian': 'd',
+    'versi': 'q',
+}
+CATEGORY_COLUMNS = ['jenis_zakat', 'metode_pembayaran']
+TEXT_COLUMNS = ['nama', 'tanggal_bayar', 'tanggal_input']
+
+# History filter: inclusive 'YYYY-MM-DD' bounds and the allowed category values;
+# None / () leave that field unfiltered. Hashable, so it can key caches.
+PaymentFilter = namedtuple('PaymentFilter', ['date_from', 'date_to', 'jenis_zakat', 'metode_pembayaran'],
+                           defaults=(None, None, (), ()))
+
+
+def _coerce(typecode, value):
+    return int(value) if typecode == 'q' else float(value)
+
+
+class PaymentTable:
+    """Column-oriented in-memory payment table
+
+    Numbers live in typed arrays, jenis_zakat and metode_pembayaran as small
+    integer codes into a category list, so a payment costs a few dozen bytes
+    instead of a dict. Deleted rows are only marked dead and squeezed out
+    once they outnumber the live ones. Sort orders, category postings and
+    filter masks are cached until the next change.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.clear()
+
+    def clear(self):
+        self._numeric = {col: array(code) for col, code in NUMERIC_COLUMNS.items()}
+        self._codes = {col: array('h') for col in CATEGORY_COLUMNS}
+        self._categories = {col: [] for col in CATEGORY_COLUMNS}
+        self._category_codes = {col: {} for col in CATEGORY_COLUMNS}
+        self._text = {col: [] for col in TEXT_COLUMNS}
+        self._alive = bytearray()
+        self._row_of = {}
+        self._changed()
+
+    def _changed(self):
+        # sort key -> (live rows in that order, their sort keys)
+        self._orders = {}
+        # category column -> value -> rows holding it, dead rows included
+        self._postings = {}
+        # PaymentFilter -> boolean mask over rows
+        self._selections = {}
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def __contains__(self, payment_id):
+        return payment_id in self._row_of
+
+    def _code(self, column, value):
+        codes = self._category_codes[column]
+        if value not in codes:
+            codes[value] = len(self._categories[column])
+            self._categories[column].append(value)
+        return codes[value]
+
+    def _set(self, row, column, value):
+        if column in NUMERIC_COLUMNS:
+            self._numeric[column][row] = _coerce(NUMERIC_COLUMNS[column], value)
+        elif column in CATEGORY_COLUMNS:
+            self._codes[column][row] = self._code(column, value)
+        elif column in TEXT_COLUMNS:
+            self._text[column][row] = value
+
+    def _value(self, row, column):
+        if column in NUMERIC_COLUMNS:
+            return self._numeric[column][row]
+        if column in CATEGORY_COLUMNS:
+            return self._categories[column][self._codes[column][row]]
+        return self._text[column][row]
+
+    def append(self, payment):
+        """Add a payment; ids must arrive in increasing order"""
+        row = len(self._alive)
+        for col, values in self._numeric.items():
+            values.append(_coerce(values.typecode, payment[col]))
+        for col, codes in self._codes.items():
+            codes.append(self._code(col, payment[col]))
+        for col, values in self._text.items():
+            values.append(payment[col])
+        self._alive.append(1)
+        self._row_of[payment['id']] = row
+        self._changed()
+
+    def get(self, payment_id):
+        """Payment as a dict, or None"""
+        row = self._row_of.get(payment_id)
+        if row is None:
+            return None
+        return {col: self._value(row, col) for col in self.columns}
+
+    def update(self, payment_id, data):
+        """Overwrite the given columns of a payment"""
+        row = self._row_of[payment_id]
+        for col, value in data.items():
+            self._set(row, col, value)
+        self._changed()
+
+    def delete(self, payment_id):
+        self._alive[self._row_of.pop(payment_id)] = 0
+        self._changed()
+        if len(self._alive) > 1024 and len(self._alive) > 2 * len(self._row_of):
+            self._squeeze()
+
+    def _squeeze(self):
+        """Drop dead rows from every column"""
+        keep = [row for row, alive in enumerate(self._alive) if alive]
+        for col, values in self._numeric.items():
+            self._numeric[col] = array(values.typecode, (values[row] for row in keep))
+        for col, codes in self._codes.items():
+            self._codes[col] = array('h', (codes[row] for row in keep))
+        for col, values in self._text.items():
+            self._text[col] = [values[row] for row in keep]
+        self._alive = bytearray(b'\x01' * len(keep))
+        self._row_of = {payment_id: row for row, payment_id in enumerate(self._numeric['id'])}
+
+    def row_lists(self):
+        """Live payments as value lists in column order (for snapshots)"""
+        return [[self._value(row, col) for col in self.columns]
+                for row, alive in enumerate(self._alive) if alive]
+
+    def _column_slice(self, column, start, end):
+        if column in NUMERIC_COLUMNS:
+            return self._numeric[column][start:end]
+        if column in CATEGORY_COLUMNS:
+            categories = self._categories[column]
+            return [categories[code] for code in self._codes[column][start:end]]
+        return self._text[column][start:end]
+
+    def rows_after(self, last_id, limit, columns, filters=None):
+        """Value tuples for live payments with id > last_id, scanning at most ``limit`` rows
+
+        Only payments matching ``filters`` (a PaymentFilter) are returned, if given.
+
+        Returns the tuples and the last id scanned, to pass back in for the
+        next chunk. Paging by id keeps working if rows are squeezed in between.
+        """
+        ids = self._numeric['id']
+        start = bisect.bisect_right(ids, last_id)
+        end = min(start + limit, len(ids))
+        if start >= end:
+            return [], last_id
+        rows = list(zip(*(self._column_slice(col, start, end) for col in columns)))
+        if filters and any(filters):
+            keep = self._selection(filters)[start:end].tolist()
+        else:
+            keep = self._alive[start:end]
+        if not all(keep):
+            rows = [row for row, matched in zip(rows, keep) if matched]
+        return rows, ids[end - 1]
+
+    def _rows_frame(self, rows):
+        """A new DataFrame of the given physical rows"""
+        import pandas as pd
+
+        data = {}
+        for col in self.columns:
+            if col in CATEGORY_COLUMNS:
+                data[col] = pd.Categorical.from_codes(
+                    [self._codes[col][row] for row in rows], categories=self._categories[col])
+            else:
+                data[col] = [self._value(row, col) for row in rows]
+        return pd.DataFrame(data, columns=self.columns)
+
+    def tail(self, limit):
+        """The last ``limit`` live payments as a new DataFrame in id order"""
+        rows = []
+        row = len(self._alive) - 1
+        while row >= 0 and len(rows) < limit:
+            if self._alive[row]:
+                rows.append(row)
+            row -= 1
+        rows.reverse()
+        return self._rows_frame(rows)
+
+    def _sort_values(self, column, rows):
+        import numpy as np
+
+        if column in NUMERIC_COLUMNS:
+            return np.array(self._numeric[column])[rows]
+        if column in CATEGORY_COLUMNS:
+            # Rank of each category name, so codes sort alphabetically
+            rank = np.argsort(np.argsort(np.array(self._categories[column], dtype=str)))
+            return rank[np.array(self._codes[column], dtype=np.int16)[rows]]
+        return np.array(self._text[column], dtype=object)[rows]
+
+    def _order(self, sort_by):
+        """Live rows sorted by a column, ties broken by id, with their values; cached until the next change"""
+        import numpy as np
+        import pandas as pd
+
+        if sort_by not in self._orders:
+            rows = np.flatnonzero(np.frombuffer(bytes(self._alive), dtype=np.bool_))
+            ids = np.array(self._numeric['id'])[rows]
+            values = self._sort_values(sort_by, rows)
+            # Text sorts as integer codes: factorize hashes, then only the distinct values are compared
+            keys = pd.factorize(values, sort=True)[0] if values.dtype == object else values
+            order = np.lexsort((ids, keys))
+            self._orders[sort_by] = (rows[order], values[order])
+        return self._orders[sort_by]
+
+    def _category_postings(self, column):
+        """Rows per category value, from one stable argsort of the codes"""
+        import numpy as np
+
+        if column not in self._postings:
+            codes = np.array(self._codes[column], dtype=np.int16)
+            rows = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[rows], np.arange(len(self._categories[column]) + 1))
+            self._postings[column] = {value: rows[bounds[code]:bounds[code + 1]]
+                                      for code, value in enumerate(self._categories[column])}
+        return self._postings[column]
+
+    def _row_mask(self, rows):
+        import numpy as np
+
+        mask = np.zeros(len(self._alive), dtype=np.bool_)
+        mask[rows] = True
+        return mask
+
+    def _selection(self, filters):
+        """Live rows matching a PaymentFilter as a boolean mask; cached until the next change
+
+        The date range is two binary searches in the rows sorted by
+        tanggal_bayar; each category condition is the union of its values'
+        posting lists.
+        """
+        import numpy as np
+
+        if filters not in self._selections:
+            mask = np.frombuffer(bytes(self._alive), dtype=np.bool_).copy()
+            if filters.date_from or filters.date_to:
+                rows, dates = self._order('tanggal_bayar')
+                start = np.searchsorted(dates, filters.date_from, 'left') if filters.date_from else 0
+                end = np.searchsorted(dates, filters.date_to, 'right') if filters.date_to else len(rows)
+                mask &= self._row_mask(rows[start:end])
+            for column in CATEGORY_COLUMNS:
+                values = getattr(filters, column)
+                if values:
+                    postings = self._category_postings(column)
+                    mask &= self._row_mask(np.concatenate(
+                        [postings.get(value, np.empty(0, dtype=np.intp)) for value in values]))
+            self._selections[filters] = mask
+        return self._selections[filters]
+
+    def count(self, filters=None):
+        """Number of live payments, or of those matching a PaymentFilter"""
+        if not filters or not any(filters):
+            return len(self._row_of)
+        return int(self._selection(filters).sum())
+
+    def page(self, offset, limit, sort_by='id', descending=False, filters=None):
+        """One page of live payments as a new DataFrame, sorted by ``sort_by``"""
+        order = self._order(sort_by)[0]
+        if filters and any(filters):
+            order = order[self._selection(filters)[order]]
+        if descending:
+            order = order[::-1]
+        return self._rows_frame(order[offset:offset + limit].tolist())
+
+
+def _sen(amount):
+    """Rupiah amount as whole sen, so running sums never drift"""
+    return round(amount * 100)
+
+
+class LedgerTotals:
+    """Running ledger totals, adjusted in O(1) for every payment change
+
+    Amounts are kept as integer sen, so removing a payment always brings the
+    totals back exactly to what they were before it was added.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self._total_bayar = 0
+        self._kembalian = 0
+        # column -> value -> [count, total_bayar in sen]
+        self._groups = {col: {} for col in CATEGORY_COLUMNS}
+
+    def _adjust(self, jenis_zakat, metode_pembayaran, count, total_bayar, kembalian):
+        self.count += count
+        self._total_bayar += total_bayar
+        self._kembalian += kembalian
+        for col, key in (('jenis_zakat', jenis_zakat), ('metode_pembayaran', metode_pembayaran)):
+            group = self._groups[col].setdefault(key, [0, 0])
+            group[0] += count
+            group[1] += total_bayar
+            if group[0] == 0:
+                del self._groups[col][key]
+
+    def add(self, payment):
+        self._adjust(payment['jenis_zakat'], payment['metode_pembayaran'], 1,
+                     _sen(payment['total_bayar']), _sen(payment['kembalian']))
+
+    def remove(self, payment):
+        self._adjust(payment['jenis_zakat'], payment['metode_pembayaran'], -1,
+                     -_sen(payment['total_bayar']), -_sen(payment['kembalian']))
+
+    def add_group(self, jenis_zakat, metode_pembayaran, count, total_bayar, kembalian):
+        """Fold in pre-aggregated payments, e.g. one row of a GROUP BY"""
+        self._adjust(jenis_zakat, metode_pembayaran, count, _sen(total_bayar), _sen(kembalian))
+
+    def summary(self):
+        """Plain-dict copy of the totals for display"""
+        return {
+            'count': self.count,
+            'total_bayar': self._total_bayar / 100,
+            'kembalian': self._kembalian / 100,
+            **{col: {key: (count, total / 100) for key, (count, total) in sorted(groups.items())}
+               for col, groups in self._groups.items()},
+        }
+
+
+class RollupCube:
+    """Payment count, total_bayar and jumlah_jiwa per (tanggal_bayar, jenis_zakat, metode_pembayaran)
+
+    Adjusted on every payment change like LedgerTotals, so a report reads
+    one cell per day, jenis and metode that occur instead of every payment.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # (tanggal_bayar, jenis_zakat, metode_pembayaran) -> [count, total_bayar in sen, jumlah_jiwa]
+        self._cells = {}
+
+    def __len__(self):
+        return len(self._cells)
+
+    def _adjust(self, key, count, total_bayar, jumlah_jiwa):
+        cell = self._cells.setdefault(key, [0, 0, 0])
+        cell[0] += count
+        cell[1] += total_bayar
+        cell[2] += jumlah_jiwa
+        if cell[0] == 0:
+            del self._cells[key]
+
+    def add(self, payment):
+        self._adjust((payment['tanggal_bayar'], payment['jenis_zakat'], payment['metode_pembayaran']),
+                     1, _sen(payment['total_bayar']), int(payment['jumlah_jiwa']))
+
+    def remove(self, payment):
+        self._adjust((payment['tanggal_bayar'], payment['jenis_zakat'], payment['metode_pembayaran']),
+                     -1, -_sen(payment['total_bayar']), -int(payment['jumlah_jiwa']))
+
+    def add_group(self, tanggal_bayar, jenis_zakat, metode_pembayaran, count, total_bayar, jumlah_jiwa):
+        """Fold in pre-aggregated payments, e.g. one row of a GROUP BY"""
+        self._adjust((tanggal_bayar, jenis_zakat, metode_pembayaran), count, _sen(total_bayar), jumlah_jiwa)
+
+    def cells(self, filters=None):
+        """Cells matching a PaymentFilter as (tanggal_bayar, jenis_zakat, metode_pembayaran,
+        count, total_bayar, jumlah_jiwa) tuples, in key order"""
+        rows = []
+        for (tanggal, jenis, metode), (count, total, jiwa) in sorted(self._cells.items()):
+            if filters:
+                if (filters.date_from and tanggal < filters.date_from) or (filters.date_to and tanggal > filters.date_to):
+                    continue
+                if (filters.jenis_zakat and jenis not in filters.jenis_zakat) or (
+                        filters.metode_pembayaran and metode not in filters.metode_pembayaran):
+                    continue
+            rows.append((tanggal, jenis, metode, count, total / 100, jiwa))
+        return rows
+
+
+def _normalize_name(nama):
+    return ' '.join(str(nama).casefold().split())
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class NameIndex:
+    """Search index over payment names
+
+    Queries of one or two characters match the start of any word in a name
+    through a sorted word list; longer queries match anywhere in the name
+    through trigram posting sets, intersected smallest first. Removed names
+    leave stale word entries behind, which searches skip and which are
+    dropped once they make up half the list.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._names = {}
+        # (word, id) pairs, sorted lazily before a prefix search
+        self._words = []
+        self._words_sorted = True
+        self._stale_words = 0
+        self._trigrams = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, payment_id, nama):
+        name = _normalize_name(nama)
+        self._names[payment_id] = name
+        self._words.extend((word, payment_id) for word in set(name.split()))
+        self._words_sorted = False
+        for gram in _trigrams(name):
+            self._trigrams.setdefault(gram, set()).add(payment_id)
+
+    def remove(self, payment_id):
+        name = self._names.pop(payment_id, None)
+        if name is None:
+            return
+        self._stale_words += len(set(name.split()))
+        for gram in _trigrams(name):
+            postings = self._trigrams[gram]
+            postings.discard(payment_id)
+            if not postings:
+                del self._trigrams[gram]
+
+    def _word_matches(self, prefix):
+        if self._stale_words * 2 > len(self._words):
+            # dict.fromkeys also drops duplicates left by a remove + re-add
+            self._words = [(word, payment_id) for word, payment_id in dict.fromkeys(self._words)
+                           if word in self._names.get(payment_id, '').split()]
+            self._stale_words = 0
+        if not self._words_sorted:
+            self._words.sort()
+            self._words_sorted = True
+        matches = set()
+        i = bisect.bisect_left(self._words, (prefix,))
+        while i < len(self._words) and self._words[i][0].startswith(prefix):
+            word, payment_id = self._words[i]
+            name = self._names.get(payment_id)
+            if name is not None and word in name.split():
+                matches.add(payment_id)
+            i += 1
+        return matches
+
+    def _substring_matches(self, query):
+        postings = sorted((self._trigrams.get(gram, set()) for gram in _trigrams(query)), key=len)
+        candidates = set.intersection(*postings) if postings[0] else set()
+        return {payment_id for payment_id in candidates if query in self._names[payment_id]}
+
+    def search(self, query, limit=20):
+        """Ids of up to ``limit`` matching payments: names starting with the query first, then newest first"""
+        query = _normalize_name(query)
+        if not query:
+            return []
+        matches = self._word_matches(query) if len(query) < 3 else self._substring_matches(query)
+        return heapq.nsmallest(limit, matches,
+                               key=lambda payment_id: (not self._names[payment_id].startswith(query), -payment_id))
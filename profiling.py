@@ -0,0 +1,132 @@
+import cProfile
+import importlib.util
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+# Instrumentation is off unless ZAKAT_PROFILE is set; sections then cost two clock reads
+PROFILE_ENABLED = os.environ.get("ZAKAT_PROFILE", "") not in ("", "0")
+PROFILE_DIR = os.environ.get("ZAKAT_PROFILE_DIR", "zakat_profiles")
+# The performance panel is shown to sessions opened with ?admin=<token>
+ADMIN_TOKEN = os.environ.get("ZAKAT_ADMIN_TOKEN")
+# Reruns kept per session for the panel
+HISTORY_SIZE = 50
+
+PROFILERS = ['cProfile'] + (['pyinstrument'] if importlib.util.find_spec('pyinstrument') else [])
+
+# Streamlit runs each session's script in its own thread
+_local = threading.local()
+_logger = logging.getLogger("zakat.profile")
+
+
+def _log_handler():
+    """Append one JSON line per rerun to the profile log"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    handler = logging.FileHandler(os.path.join(PROFILE_DIR, "reruns.log"), encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    return handler
+
+
+if PROFILE_ENABLED and not _logger.handlers:
+    _logger.addHandler(_log_handler())
+    _logger.setLevel(logging.INFO)
+    _logger.propagate = False
+
+
+def is_admin(token):
+    """Whether a session's admin token unlocks the performance panel"""
+    return PROFILE_ENABLED and bool(ADMIN_TOKEN) and token == ADMIN_TOKEN
+
+
+@contextmanager
+def section(name):
+    """Time a block of the current rerun; nested sections are recorded as 'outer/inner'"""
+    record = getattr(_local, 'record', None)
+    if record is None:
+        yield
+        return
+    path = f"{_local.path}/{name}" if _local.path else name
+    outer, _local.path = _local.path, path
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        record['sections'][path] = record['sections'].get(path, 0.0) + elapsed
+        _local.path = outer
+
+
+def timed(name):
+    """Decorator form of section() for page functions"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with section(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _start_profiler(profiler):
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+
+        sampler = Profiler()
+        sampler.start()
+    else:
+        sampler = cProfile.Profile()
+        sampler.enable()
+    return sampler
+
+
+def _save_profile(profiler, sampler, page):
+    """Write a finished profile under PROFILE_DIR and return its path and a text summary"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = os.path.join(PROFILE_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{page.replace(' ', '_')}")
+    if profiler == 'pyinstrument':
+        sampler.stop()
+        path = f"{stem}.html"
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(sampler.output_html())
+        return path, sampler.output_text(unicode=True)
+    sampler.disable()
+    path = f"{stem}.prof"
+    sampler.dump_stats(path)
+    summary = io.StringIO()
+    pstats.Stats(sampler, stream=summary).sort_stats('cumulative').print_stats(25)
+    return path, summary.getvalue()
+
+
+@contextmanager
+def profile_rerun(page, history, profiler=None):
+    """Record the timings of one rerun of ``page`` into ``history`` and the log
+
+    ``history`` is the session's list of earlier reruns, newest last. With
+    ``profiler`` ('cProfile' or 'pyinstrument') the whole rerun is also
+    profiled and the profile file saved. A no-op unless ZAKAT_PROFILE is set.
+    """
+    if not PROFILE_ENABLED:
+        yield
+        return
+    record = {'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'page': page, 'sections': {}}
+    _local.record, _local.path = record, ''
+    sampler = _start_profiler(profiler) if profiler else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record['total_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        record['sections'] = {path: round(ms, 1) for path, ms in record['sections'].items()}
+        _local.record = None
+        if sampler is not None:
+            record['profile'], record['profile_summary'] = _save_profile(profiler, sampler, page)
+        history.append(record)
+        del history[:-HISTORY_SIZE]
+        _logger.info(json.dumps({key: value for key, value in record.items() if key != 'profile_summary'}))
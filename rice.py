@@ -0,0 +1,158 @@
+import bisect
+
+# Zakat fitrah per person, in kg of rice
+KG_PER_JIWA = 2.5
+
+
+def fitrah_due(jumlah_jiwa, harga_per_kg, kg_per_jiwa=KG_PER_JIWA):
+    """Zakat fitrah due in Rupiah: jiwa x kg per jiwa x rice price per kg
+
+    Takes numbers or whole columns (arrays or Series, broadcast against each
+    other), so pricing thousands of households is one array multiply.
+    """
+    import numpy as np
+
+    return np.round(np.multiply(jumlah_jiwa, kg_per_jiwa) * harga_per_kg, 2)
+
+
+class RicePriceRegistry:
+    """Rice prices per kg with statistics kept up to date on every change
+
+    Prices are kept in id order for display, in a sorted list for min/max,
+    in a value -> count map for duplicate checks and as a running sum in
+    sen for the mean, so none of them needs a pass over all prices.
+    """
+
+    def __init__(self, prices=()):
+        self.clear()
+        for harga in prices:
+            self.add(harga)
+
+    def clear(self):
+        # id -> harga in id order, sorted hargas, harga -> count
+        self._prices = {}
+        self._sorted = []
+        self._counts = {}
+        self._sum = 0
+        self._last_id = 0
+
+    def __len__(self):
+        return len(self._prices)
+
+    def __contains__(self, harga):
+        return harga in self._counts
+
+    def __iter__(self):
+        """Prices as {'id', 'harga'} dicts in id order"""
+        return ({'id': price_id, 'harga': harga} for price_id, harga in self._prices.items())
+
+    def tiers(self):
+        """Distinct prices, cheapest first"""
+        return sorted(self._counts)
+
+    def add(self, harga):
+        """Add a price and return its id"""
+        harga = float(harga)
+        self._last_id += 1
+        self._prices[self._last_id] = harga
+        bisect.insort(self._sorted, harga)
+        self._counts[harga] = self._counts.get(harga, 0) + 1
+        self._sum += round(harga * 100)
+        return self._last_id
+
+    def delete(self, price_id):
+        harga = self._prices.pop(price_id, None)
+        if harga is None:
+            return
+        del self._sorted[bisect.bisect_left(self._sorted, harga)]
+        self._counts[harga] -= 1
+        if not self._counts[harga]:
+            del self._counts[harga]
+        self._sum -= round(harga * 100)
+
+    @property
+    def mean(self):
+        return self._sum / 100 / len(self._prices) if self._prices else None
+
+    @property
+    def min(self):
+        return self._sorted[0] if self._sorted else None
+
+    @property
+    def max(self):
+        return self._sorted[-1] if self._sorted else None
+
+
+class RicePriceHistory:
+    """Reference rice price per kg by effective date ('YYYY-MM-DD')
+
+    A price applies from its date until the next one, so the price in
+    effect on a day is a binary search in the sorted dates; as_of_many()
+    does the same for a whole column of dates in one searchsorted.
+    """
+
+    def __init__(self, entries=()):
+        self._dates = []
+        self._prices = []
+        for tanggal, harga in entries:
+            self.set(tanggal, harga)
+
+    def __len__(self):
+        return len(self._dates)
+
+    def __iter__(self):
+        """(tanggal, harga) pairs, earliest first"""
+        return iter(list(zip(self._dates, self._prices)))
+
+    def set(self, tanggal, harga):
+        """Make ``harga`` the price from ``tanggal`` on, replacing one set for the same day"""
+        i = bisect.bisect_left(self._dates, tanggal)
+        if i < len(self._dates) and self._dates[i] == tanggal:
+            self._prices[i] = float(harga)
+        else:
+            self._dates.insert(i, tanggal)
+            self._prices.insert(i, float(harga))
+
+    def remove(self, tanggal):
+        i = bisect.bisect_left(self._dates, tanggal)
+        if i < len(self._dates) and self._dates[i] == tanggal:
+            del self._dates[i]
+            del self._prices[i]
+
+    def as_of(self, tanggal):
+        """Price in effect on ``tanggal``, or None before the first effective date"""
+        i = bisect.bisect_right(self._dates, tanggal) - 1
+        return self._prices[i] if i >= 0 else None
+
+    def as_of_many(self, dates):
+        """Prices in effect on each of ``dates`` as a float array, NaN where none applies yet"""
+        import numpy as np
+
+        positions = np.searchsorted(np.array(self._dates, dtype=str), np.asarray(dates, dtype=str), side='right')
+        # Position 0 (before the first date) wraps around to the trailing NaN
+        return np.array(self._prices + [np.nan])[positions - 1]
+
+
+def revalue_fitrah(chunks, history, kg_per_jiwa=KG_PER_JIWA):
+    """Fitrah payments against their value at the price in effect on each tanggal_bayar
+
+    ``chunks`` yields lists of (jumlah_jiwa, total_bayar, tanggal_bayar)
+    tuples, as a store's iter_chunks() does, so the ledger is revalued a
+    chunk at a time with one as-of lookup per chunk. Payments dated before
+    the first effective date are counted apart and left out of the sums.
+    """
+    import numpy as np
+
+    summary = {'count': 0, 'total_bayar': 0.0, 'nilai_acuan': 0.0, 'tanpa_harga': 0}
+    for chunk in chunks:
+        if not chunk:
+            continue
+        jiwa, total, dates = (np.asarray(column) for column in zip(*chunk))
+        due = fitrah_due(jiwa.astype(float), history.as_of_many(dates), kg_per_jiwa)
+        priced = ~np.isnan(due)
+        summary['count'] += int(priced.sum())
+        summary['tanpa_harga'] += int((~priced).sum())
+        summary['total_bayar'] += float(total.astype(float)[priced].sum())
+        summary['nilai_acuan'] += float(due[priced].sum())
+    summary['selisih'] = summary['total_bayar'] - summary['nilai_acuan']
+    return summary
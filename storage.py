@@ -0,0 +1,1102 @@
+import atexit
+import json
+import logging
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from ledger import CATEGORY_COLUMNS, LedgerTotals, NameIndex, PaymentTable, RollupCube
+
+_logger = logging.getLogger("zakat.storage")
+
+# Column order used when reading payments back out of the store
+PAYMENT_COLUMNS = ['id', 'nama', 'jumlah_jiwa', 'jenis_zakat', 'metode_pembayaran',
+                   'total_bayar', 'nominal_dibayar', 'kembalian', 'tanggal_bayar', 'tanggal_input', 'versi']
+
+# Columns a caller may set; id, tanggal_input and versi are owned by the store
+EDITABLE_COLUMNS = ['nama', 'jumlah_jiwa', 'jenis_zakat', 'metode_pembayaran',
+                    'total_bayar', 'nominal_dibayar', 'kembalian', 'tanggal_bayar']
+
+# Columns the history page can be sorted by; ties are always broken by id
+SORT_COLUMNS = ['id', 'tanggal_bayar', 'nama', 'jenis_zakat', 'total_bayar']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS payments (
+    id INTEGER PRIMARY KEY,
+    nama TEXT NOT NULL,
+    jumlah_jiwa INTEGER NOT NULL DEFAULT 1,
+    jenis_zakat TEXT NOT NULL,
+    metode_pembayaran TEXT NOT NULL,
+    total_bayar REAL NOT NULL,
+    nominal_dibayar REAL NOT NULL,
+    kembalian REAL NOT NULL DEFAULT 0,
+    tanggal_bayar TEXT NOT NULL,
+    tanggal_input TEXT NOT NULL,
+    versi INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_payments_tanggal_bayar ON payments (tanggal_bayar);
+CREATE INDEX IF NOT EXISTS idx_payments_jenis_zakat ON payments (jenis_zakat);
+CREATE INDEX IF NOT EXISTS idx_payments_metode_pembayaran ON payments (metode_pembayaran);
+CREATE INDEX IF NOT EXISTS idx_payments_nama ON payments (nama);
+CREATE INDEX IF NOT EXISTS idx_payments_total_bayar ON payments (total_bayar);
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    payment_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS id_sequence (
+    name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO id_sequence (name, last_id)
+    SELECT 'payments', COALESCE(MAX(id), 0) FROM payments;
+CREATE TABLE IF NOT EXISTS rice_price_history (
+    tanggal TEXT PRIMARY KEY,
+    harga REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS payment_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    sign INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    nama TEXT NOT NULL,
+    jumlah_jiwa INTEGER NOT NULL,
+    jenis_zakat TEXT NOT NULL,
+    metode_pembayaran TEXT NOT NULL,
+    total_bayar REAL NOT NULL,
+    kembalian REAL NOT NULL,
+    tanggal_bayar TEXT NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS payments_insert_logged AFTER INSERT ON payments BEGIN
+    INSERT INTO payment_changes (sign, id, nama, jumlah_jiwa, jenis_zakat, metode_pembayaran,
+                                 total_bayar, kembalian, tanggal_bayar)
+    VALUES (1, NEW.id, NEW.nama, NEW.jumlah_jiwa, NEW.jenis_zakat, NEW.metode_pembayaran,
+            NEW.total_bayar, NEW.kembalian, NEW.tanggal_bayar);
+END;
+CREATE TRIGGER IF NOT EXISTS payments_update_logged AFTER UPDATE ON payments BEGIN
+    INSERT INTO payment_changes (sign, id, nama, jumlah_jiwa, jenis_zakat, metode_pembayaran,
+                                 total_bayar, kembalian, tanggal_bayar)
+    VALUES (-1, OLD.id, OLD.nama, OLD.jumlah_jiwa, OLD.jenis_zakat, OLD.metode_pembayaran,
+            OLD.total_bayar, OLD.kembalian, OLD.tanggal_bayar),
+           (1, NEW.id, NEW.nama, NEW.jumlah_jiwa, NEW.jenis_zakat, NEW.metode_pembayaran,
+            NEW.total_bayar, NEW.kembalian, NEW.tanggal_bayar);
+END;
+CREATE TRIGGER IF NOT EXISTS payments_delete_logged AFTER DELETE ON payments BEGIN
+    INSERT INTO payment_changes (sign, id, nama, jumlah_jiwa, jenis_zakat, metode_pembayaran,
+                                 total_bayar, kembalian, tanggal_bayar)
+    VALUES (-1, OLD.id, OLD.nama, OLD.jumlah_jiwa, OLD.jenis_zakat, OLD.metode_pembayaran,
+            OLD.total_bayar, OLD.kembalian, OLD.tanggal_bayar);
+END;
+"""
+
+# Entries of payment_changes kept for other connections to catch up from;
+# one that falls further behind reloads everything instead
+CHANGE_LOG_KEEP = 10000
+
+
+class VersionConflict(Exception):
+    """A payment was changed or deleted since the caller read the version it expected
+
+    ``current`` is the payment as stored now, or None if it was deleted.
+    """
+
+    def __init__(self, payment_id, expected_version, current):
+        super().__init__(f"Payment {payment_id} is no longer at version {expected_version}")
+        self.payment_id = payment_id
+        self.expected_version = expected_version
+        self.current = current
+
+
+def _check_version(payment_id, expected_version, current):
+    """Raise VersionConflict unless expected_version is None or matches the stored payment"""
+    if expected_version is not None and (current is None or current['versi'] != expected_version):
+        raise VersionConflict(payment_id, expected_version, current)
+
+
+def _check_amounts(payments):
+    """Raise ValueError for a payment whose numbers the ledger's running sums cannot hold
+
+    Called before anything is written, so a bad payment never reaches the
+    store where it would break loading the totals on every later open.
+    """
+    for payment in payments:
+        for col in ('jumlah_jiwa', 'total_bayar', 'nominal_dibayar', 'kembalian'):
+            if not math.isfinite(payment[col]):
+                raise ValueError(f"{col} must be a finite number, got {payment[col]!r}")
+
+
+class IdAllocator:
+    """Hands out payment ids that are never reused
+
+    Stores persist the highest id ever issued and ask for the next one
+    after it, so deleting the newest payment does not free its id. Replicas
+    that do not share a store get disjoint sequences: replica ``r`` of ``n``
+    only issues ids congruent to ``r + 1`` modulo ``n``, so their ledgers
+    can be merged without collisions.
+    """
+
+    def __init__(self, replica_id=0, replica_count=1):
+        if not 0 <= replica_id < replica_count:
+            raise ValueError(f"replica_id must be in [0, {replica_count}), got {replica_id}")
+        self.replica_id = replica_id
+        self.replica_count = replica_count
+
+    def next_after(self, last_id):
+        """Smallest id owned by this replica that is greater than last_id"""
+        candidate = last_id + 1
+        return candidate + (self.replica_id + 1 - candidate) % self.replica_count
+
+
+def _where_clause(filters, clauses=None):
+    """SQL WHERE clause and parameters for a PaymentFilter"""
+    clauses = list(clauses or [])
+    params = []
+    if filters:
+        if filters.date_from:
+            clauses.append("tanggal_bayar >= ?")
+            params.append(filters.date_from)
+        if filters.date_to:
+            clauses.append("tanggal_bayar <= ?")
+            params.append(filters.date_to)
+        # With a date range, unary + keeps the planner on the tanggal_bayar index
+        # instead of a far less selective category index
+        prefix = '+' if filters.date_from or filters.date_to else ''
+        for column in CATEGORY_COLUMNS:
+            values = list(getattr(filters, column))
+            if values:
+                clauses.append(f"{prefix}{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+class SQLitePaymentStore:
+    """Payment store backed by a SQLite database in WAL mode
+
+    Every payment carries a versi that each update bumps. update() and
+    delete() take the version the caller last read and only apply if it
+    is still current (compare-and-swap), so concurrent editors get a
+    VersionConflict instead of silently overwriting each other.
+
+    Triggers record every row change in payment_changes, so when another
+    process (the ingest server) commits, the in-memory totals, cube and
+    name index are brought up to date from just the changed rows.
+    """
+
+    def __init__(self, path, id_allocator=None):
+        self.path = path
+        self.id_allocator = id_allocator or IdAllocator()
+        self._lock = threading.Lock()
+        # One connection shared by every Streamlit session thread, guarded by _lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # Ledgers created before payments were versioned
+        if 'versi' not in {row['name'] for row in self._conn.execute("PRAGMA table_info(payments)")}:
+            with self._conn:
+                self._conn.execute("ALTER TABLE payments ADD COLUMN versi INTEGER NOT NULL DEFAULT 1")
+
+        # In-memory state derived from the table, kept current by our own writes
+        self._totals = LedgerTotals()
+        self._cube = RollupCube()
+        # Built on the first search after a reload; None until then
+        self._names = None
+        self._data_version = None
+        # Last payment_changes entry reflected in the derived state
+        self._log_seq = None
+        self._version = 0
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        """Apply changes another connection has committed to derived state; caller holds _lock"""
+        # data_version only moves on commits from other connections
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        if self._conn.in_transaction:
+            self._catch_up()
+        else:
+            # One read transaction, so the changes and the log position agree
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._catch_up()
+
+    def _last_change(self):
+        row = self._conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'payment_changes'").fetchone()
+        return row[0] if row else 0
+
+    def _catch_up(self):
+        """Apply payment_changes entries past _log_seq, or reload if some were pruned"""
+        last = self._last_change()
+        if last == self._log_seq:
+            return
+        changes = [] if self._log_seq is None else self._conn.execute(
+            "SELECT * FROM payment_changes WHERE seq > ? ORDER BY seq", (self._log_seq,)).fetchall()
+        self._changed()
+        if self._log_seq is None or len(changes) != last - self._log_seq:
+            self._reload()
+        else:
+            for change in changes:
+                if change['sign'] > 0:
+                    self._totals.add(change)
+                    self._cube.add(change)
+                    if self._names is not None:
+                        self._names.add(change['id'], change['nama'])
+                else:
+                    self._totals.remove(change)
+                    self._cube.remove(change)
+                    if self._names is not None:
+                        self._names.remove(change['id'])
+        self._log_seq = last
+
+    def _logged(self):
+        """Position of the change log after this transaction's own writes, which are
+        applied directly; prunes old entries. Caller is in a write transaction"""
+        last = self._last_change()
+        self._conn.execute("DELETE FROM payment_changes WHERE seq <= ?", (last - CHANGE_LOG_KEEP,))
+        return last
+
+    def _reload(self):
+        """Rebuild derived state from the whole table"""
+        self._totals.clear()
+        self._cube.clear()
+        groups = self._conn.execute(
+            "SELECT tanggal_bayar, jenis_zakat, metode_pembayaran, COUNT(*), SUM(total_bayar), "
+            "SUM(kembalian), SUM(jumlah_jiwa) FROM payments GROUP BY tanggal_bayar, jenis_zakat, metode_pembayaran"
+        )
+        for tanggal, jenis, metode, count, total_bayar, kembalian, jumlah_jiwa in groups:
+            self._totals.add_group(jenis, metode, count, total_bayar, kembalian)
+            self._cube.add_group(tanggal, jenis, metode, count, total_bayar, jumlah_jiwa)
+        # Indexing every name costs most of a reload; leave it to the next search
+        self._names = None
+
+    def _get(self, payment_id):
+        row = self._conn.execute("SELECT * FROM payments WHERE id = ?", (payment_id,)).fetchone()
+        return dict(row) if row else None
+
+    def add(self, payment):
+        """Insert a payment and return its new id"""
+        return self.add_many([payment])[0]
+
+    def _insert(self, payments):
+        """Insert payments under new ids and return the ids
+
+        The caller holds _lock and has begun the transaction with BEGIN
+        IMMEDIATE, which takes the write lock up front, so processes sharing
+        the database cannot read the same last_id.
+        """
+        columns = ['id'] + EDITABLE_COLUMNS + ['tanggal_input']
+        payment_id = self._conn.execute(
+            "SELECT last_id FROM id_sequence WHERE name = 'payments'").fetchone()[0]
+        ids = []
+        rows = []
+        for payment in payments:
+            payment_id = self.id_allocator.next_after(payment_id)
+            ids.append(payment_id)
+            rows.append([payment_id] + [payment[col] for col in columns[1:]])
+        self._conn.execute("UPDATE id_sequence SET last_id = ? WHERE name = 'payments'", (payment_id,))
+        self._conn.executemany(
+            f"INSERT INTO payments ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            rows
+        )
+        return ids
+
+    def _added(self, ids, payments):
+        """Bring derived state up to date once inserted payments are committed; caller holds _lock"""
+        try:
+            for payment_id, payment in zip(ids, payments):
+                self._totals.add(payment)
+                self._cube.add(payment)
+                if self._names is not None:
+                    self._names.add(payment_id, payment['nama'])
+        except Exception:
+            # The payments are committed either way; rebuild from the table on the next read
+            _logger.exception("Updating ledger totals failed, reloading them")
+            self._data_version = self._log_seq = None
+        self._changed()
+
+    def add_many(self, payments):
+        """Insert payments in a single transaction and return their new ids"""
+        payments = list(payments)
+        if not payments:
+            return []
+        _check_amounts(payments)
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._refresh()
+                ids = self._insert(payments)
+                log_seq = self._logged()
+            self._log_seq = log_seq
+            self._added(ids, payments)
+        return ids
+
+    def add_once(self, keys, payments):
+        """Insert the payments whose idempotency key is new, in a single transaction
+
+        Returns (payment_id, created) for each payment. A key stored
+        earlier, or repeated within ``keys``, gives the id of the payment
+        first added under it and created False. Keys commit together with
+        their payments, so a client that retries a request after losing the
+        response never adds a payment twice.
+        """
+        keys = list(keys)
+        payments = list(payments)
+        _check_amounts(payments)
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._refresh()
+                known = {}
+                distinct = list(dict.fromkeys(keys))
+                # In slices, to stay under SQLite's limit on bound parameters
+                for start in range(0, len(distinct), 500):
+                    batch = distinct[start:start + 500]
+                    known.update(self._conn.execute(
+                        f"SELECT key, payment_id FROM idempotency_keys WHERE key IN ({', '.join('?' * len(batch))})",
+                        batch
+                    ))
+                new_keys = []
+                new_payments = []
+                for key, payment in zip(keys, payments):
+                    if key not in known:
+                        known[key] = None
+                        new_keys.append(key)
+                        new_payments.append(payment)
+                ids = self._insert(new_payments) if new_payments else []
+                known.update(zip(new_keys, ids))
+                self._conn.executemany("INSERT INTO idempotency_keys (key, payment_id) VALUES (?, ?)",
+                                       zip(new_keys, ids))
+                log_seq = self._logged()
+            self._log_seq = log_seq
+            if ids:
+                self._added(ids, new_payments)
+        created = set(new_keys)
+        results = []
+        for key in keys:
+            results.append((known[key], key in created))
+            created.discard(key)
+        return results
+
+    def get(self, payment_id):
+        """Get a single payment by id, or None"""
+        with self._lock:
+            return self._get(payment_id)
+
+    def update(self, payment_id, payment, expected_version=None):
+        """Update the editable fields of a payment; returns True if it existed
+
+        With ``expected_version`` the update only applies if the payment is
+        still at that versi, and raises VersionConflict otherwise.
+        """
+        assignments = ', '.join(f"{col} = ?" for col in EDITABLE_COLUMNS)
+        _check_amounts([payment])
+        with self._lock:
+            with self._conn:
+                # IMMEDIATE so no other process can write between the check and the update
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._refresh()
+                old = self._get(payment_id)
+                if old is None and expected_version is None:
+                    return False
+                _check_version(payment_id, expected_version, old)
+                self._conn.execute(
+                    f"UPDATE payments SET {assignments}, versi = versi + 1 WHERE id = ?",
+                    [payment[col] for col in EDITABLE_COLUMNS] + [payment_id]
+                )
+                log_seq = self._logged()
+            self._log_seq = log_seq
+            self._totals.remove(old)
+            self._totals.add(payment)
+            self._cube.remove(old)
+            self._cube.add(payment)
+            if self._names is not None and payment['nama'] != old['nama']:
+                self._names.remove(payment_id)
+                self._names.add(payment_id, payment['nama'])
+            self._changed()
+        return True
+
+    def delete(self, payment_id, expected_version=None):
+        """Delete a payment; returns True if it existed
+
+        With ``expected_version`` the delete only applies if the payment is
+        still at that versi, and raises VersionConflict otherwise.
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._refresh()
+                old = self._get(payment_id)
+                if old is None and expected_version is None:
+                    return False
+                _check_version(payment_id, expected_version, old)
+                self._conn.execute("DELETE FROM payments WHERE id = ?", (payment_id,))
+                log_seq = self._logged()
+            self._log_seq = log_seq
+            self._totals.remove(old)
+            self._cube.remove(old)
+            if self._names is not None:
+                self._names.remove(payment_id)
+            self._changed()
+        return True
+
+    def clear(self):
+        """Delete every payment"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM payments")
+                # Other connections find the log cut short and reload
+                self._conn.execute("DELETE FROM payment_changes")
+                log_seq = self._last_change()
+            self._log_seq = log_seq
+            self._totals.clear()
+            self._cube.clear()
+            self._names = NameIndex()
+            self._changed()
+
+    def rice_price_history(self):
+        """Reference rice prices per kg as (tanggal, harga) pairs, earliest first"""
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(
+                "SELECT tanggal, harga FROM rice_price_history ORDER BY tanggal")]
+
+    def set_rice_price(self, tanggal, harga):
+        """Make ``harga`` the reference price from ``tanggal`` on, replacing one set for the same day"""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO rice_price_history (tanggal, harga) VALUES (?, ?)",
+                               (tanggal, float(harga)))
+
+    def remove_rice_price(self, tanggal):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM rice_price_history WHERE tanggal = ?", (tanggal,))
+
+    def _changed(self):
+        self._version += 1
+
+    @property
+    def version(self):
+        """Ledger version; changes whenever any payment changes"""
+        with self._lock:
+            self._refresh()
+            return self._version
+
+    def count(self, filters=None):
+        """Number of stored payments, or of those matching a PaymentFilter"""
+        with self._lock:
+            self._refresh()
+            if not filters or not any(filters):
+                return self._totals.count
+            where, params = _where_clause(filters)
+            return self._conn.execute(f"SELECT COUNT(*) FROM payments{where}", params).fetchone()[0]
+
+    def summary(self):
+        """Running totals: count, total_bayar, kembalian and per-category breakdowns"""
+        with self._lock:
+            self._refresh()
+            return self._totals.summary()
+
+    def rollup(self, filters=None):
+        """Rollup cube cells matching a PaymentFilter (see RollupCube.cells)"""
+        with self._lock:
+            self._refresh()
+            return self._cube.cells(filters)
+
+    def search(self, query, limit=20):
+        """Ids of payments whose nama matches the query, best matches first"""
+        with self._lock:
+            self._refresh()
+            if self._names is None:
+                self._names = NameIndex()
+                for payment_id, nama in self._conn.execute("SELECT id, nama FROM payments"):
+                    self._names.add(payment_id, nama)
+            return self._names.search(query, limit)
+
+    def recent(self, limit):
+        """The most recent payments as a new DataFrame, oldest first"""
+        import pandas as pd
+
+        with self._lock:
+            frame = pd.read_sql_query(
+                "SELECT * FROM payments ORDER BY id DESC LIMIT ?", self._conn, params=(limit,),
+                dtype={col: 'category' for col in CATEGORY_COLUMNS}
+            )
+        return frame.iloc[::-1].reset_index(drop=True)
+
+    def page(self, offset, limit, sort_by='id', descending=False, filters=None):
+        """One page of payments as a new DataFrame, sorted by one of SORT_COLUMNS"""
+        import pandas as pd
+
+        if sort_by not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by {sort_by!r}")
+        direction = 'DESC' if descending else 'ASC'
+        where, params = _where_clause(filters)
+        with self._lock:
+            return pd.read_sql_query(
+                f"SELECT * FROM payments{where} ORDER BY {sort_by} {direction}, id {direction} LIMIT ? OFFSET ?",
+                self._conn, params=params + [limit, offset],
+                dtype={col: 'category' for col in CATEGORY_COLUMNS}
+            )
+
+    def iter_chunks(self, columns, chunk_size=5000, filters=None):
+        """Yield payments in id order as lists of value tuples, chunk_size rows at a time
+
+        Pages by id, so memory stays bounded by one chunk and writers wait
+        for at most one chunk query. Only payments matching ``filters`` (a
+        PaymentFilter) are yielded, if given.
+        """
+        where, params = _where_clause(filters, ["id > ?"])
+        sql = f"SELECT id, {', '.join(columns)} FROM payments{where} ORDER BY id LIMIT ?"
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(sql, [last_id] + params + [chunk_size]).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [tuple(row)[1:] for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _encode_record(op, data):
+    """Journal values for a change, positional to keep each line small"""
+    if op == 'add':
+        return [data[col] for col in PAYMENT_COLUMNS]
+    if op == 'update':
+        return [data[col] for col in EDITABLE_COLUMNS]
+    if op == 'set_price':
+        return data
+    return None
+
+
+def _decode_record(op, values):
+    if op == 'add':
+        # Journals written before payments were versioned have no versi
+        return {'versi': 1, **dict(zip(PAYMENT_COLUMNS, values))}
+    if op == 'update':
+        return dict(zip(EDITABLE_COLUMNS, values))
+    if op == 'set_price':
+        return values
+    return None
+
+
+def _fsync_directory(path):
+    """Make a rename inside path durable (not supported on Windows)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class JournalPaymentStore:
+    """Payment store kept in memory and persisted as snapshot + append-only journal
+
+    Every change is appended to the journal as one compact JSON line
+    ``[seq, op, id, values]`` with values in column order. Concurrent
+    writers share fsyncs (group commit): whoever reaches the disk first
+    syncs everything appended so far and the others just wait for it. Once the journal holds ``compact_every`` records
+    a background thread folds it into a new snapshot, so startup only ever
+    replays the snapshot plus a short journal tail. A journal directory
+    belongs to a single server process.
+
+    Updates bump a payment's versi and, like deletes, can be made
+    conditional on the versi the caller last read (see SQLitePaymentStore).
+    """
+
+    SNAPSHOT_FILE = 'payments.snapshot.json'
+    JOURNAL_FILE = 'payments.journal'
+    # Journal being folded into a snapshot; kept until the snapshot is durable
+    COMPACTING_FILE = 'payments.journal.1'
+
+    def __init__(self, directory, id_allocator=None, compact_every=10000, commit_delay=0.002):
+        self.directory = directory
+        self.id_allocator = id_allocator or IdAllocator()
+        self.compact_every = compact_every
+        self.commit_delay = commit_delay
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._sync_cond = threading.Condition()
+        self._syncing = False
+        self._synced_seq = 0
+        self._compacting = False
+        self._compaction_thread = None
+
+        # Ids are issued in increasing order, so appending keeps the table in id order
+        self._payments = PaymentTable(PAYMENT_COLUMNS)
+        self._totals = LedgerTotals()
+        self._cube = RollupCube()
+        self._names = NameIndex()
+        # tanggal -> reference rice price per kg
+        self._rice_prices = {}
+        self._seq = 0
+        self._last_id = 0
+        self._journal_records = 0
+        self._recover()
+        self._synced_seq = self._seq
+
+    # -- recovery -----------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _recover(self):
+        snapshot_path = self._path(self.SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self._seq = snapshot['seq']
+            for values in snapshot['rows']:
+                payment = {'versi': 1, **dict(zip(snapshot['columns'], values))}
+                self._payments.append(payment)
+                self._totals.add(payment)
+                self._cube.add(payment)
+                self._names.add(payment['id'], payment['nama'])
+            self._rice_prices = dict(snapshot.get('rice_prices', []))
+            id_position = snapshot['columns'].index('id')
+            self._last_id = snapshot.get('last_id', max((values[id_position] for values in snapshot['rows']), default=0))
+
+        compacting_path = self._path(self.COMPACTING_FILE)
+        if os.path.exists(compacting_path):
+            self._replay(compacting_path)
+        self._journal_records = self._replay(self._path(self.JOURNAL_FILE))
+        self._journal = open(self._path(self.JOURNAL_FILE), 'a', encoding='utf-8')
+
+        # A compaction was interrupted: finish it before accepting writes
+        if os.path.exists(compacting_path):
+            self._write_snapshot(self._payments.row_lists(), self._seq, self._last_id, self._rice_prices)
+            self._journal.truncate(0)
+            self._journal_records = 0
+            os.remove(compacting_path)
+
+    def _replay(self, path):
+        """Apply journal records newer than the snapshot; returns records read"""
+        if not os.path.exists(path):
+            return 0
+        records = 0
+        good_offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    seq, op, payment_id, values = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash: everything after it is discarded
+                    break
+                good_offset += len(line)
+                records += 1
+                if seq > self._seq:
+                    self._apply(op, payment_id, _decode_record(op, values))
+                    self._seq = seq
+        if good_offset < os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(good_offset)
+        return records
+
+    def _apply(self, op, payment_id, data):
+        if op == 'add':
+            self._payments.append(data)
+            self._totals.add(data)
+            self._cube.add(data)
+            self._names.add(payment_id, data['nama'])
+            self._last_id = max(self._last_id, payment_id)
+        elif op == 'update':
+            old = self._payments.get(payment_id)
+            if old is not None:
+                self._payments.update(payment_id, {**data, 'versi': old['versi'] + 1})
+                self._totals.remove(old)
+                self._totals.add({**old, **data})
+                self._cube.remove(old)
+                self._cube.add({**old, **data})
+                if data['nama'] != old['nama']:
+                    self._names.remove(payment_id)
+                    self._names.add(payment_id, data['nama'])
+        elif op == 'delete':
+            old = self._payments.get(payment_id)
+            if old is not None:
+                self._payments.delete(payment_id)
+                self._totals.remove(old)
+                self._cube.remove(old)
+                self._names.remove(payment_id)
+        elif op == 'clear':
+            self._payments.clear()
+            self._totals.clear()
+            self._cube.clear()
+            self._names.clear()
+        elif op == 'set_price':
+            # Price records carry the tanggal in the id slot
+            self._rice_prices[payment_id] = data
+        elif op == 'remove_price':
+            self._rice_prices.pop(payment_id, None)
+
+    # -- writes ---------------------------------------------------------------
+
+    @staticmethod
+    def _record_line(seq, op, payment_id, data):
+        return json.dumps([seq, op, payment_id, _encode_record(op, data)], separators=(',', ':')) + '\n'
+
+    def _append(self, op, payment_id, data=None):
+        """Append a change to the journal and apply it in memory; caller holds _lock"""
+        self._journal.write(self._record_line(self._seq + 1, op, payment_id, data))
+        self._seq += 1
+        self._apply(op, payment_id, data)
+        self._journal_records += 1
+        return self._seq
+
+    def _commit(self, seq):
+        """Wait until seq is durable, then compact if the journal has grown too long"""
+        self._wait_durable(seq)
+        with self._lock:
+            if self._journal_records >= self.compact_every and not self._compacting:
+                self._compacting = True
+                self._compaction_thread = threading.Thread(
+                    target=self._compact, name='journal-compaction', daemon=True)
+                self._compaction_thread.start()
+
+    def _wait_durable(self, seq):
+        """Group commit: one fsync covers every record appended before it started"""
+        with self._sync_cond:
+            while self._synced_seq < seq:
+                if self._syncing:
+                    self._sync_cond.wait()
+                    continue
+                self._syncing = True
+                self._sync_cond.release()
+                try:
+                    if self.commit_delay:
+                        # Give concurrent writers a moment to join this batch
+                        time.sleep(self.commit_delay)
+                    with self._lock:
+                        target = self._seq
+                        self._journal.flush()
+                        # Own descriptor so a concurrent rotation cannot close it under us
+                        fd = os.dup(self._journal.fileno())
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                finally:
+                    self._sync_cond.acquire()
+                    self._syncing = False
+                self._synced_seq = max(self._synced_seq, target)
+                self._sync_cond.notify_all()
+
+    def _compact(self):
+        """Fold the current journal into a new snapshot"""
+        try:
+            with self._lock:
+                # Rotate the journal so writers keep appending while the snapshot is written
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+                self._journal.close()
+                os.replace(self._path(self.JOURNAL_FILE), self._path(self.COMPACTING_FILE))
+                self._journal = open(self._path(self.JOURNAL_FILE), 'a', encoding='utf-8')
+                self._journal_records = 0
+                seq = self._seq
+                last_id = self._last_id
+                rows = self._payments.row_lists()
+                rice_prices = dict(self._rice_prices)
+            self._write_snapshot(rows, seq, last_id, rice_prices)
+            os.remove(self._path(self.COMPACTING_FILE))
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def _write_snapshot(self, rows, seq, last_id, rice_prices):
+        tmp_path = self._path(self.SNAPSHOT_FILE + '.tmp')
+        snapshot = {'seq': seq, 'last_id': last_id, 'columns': PAYMENT_COLUMNS, 'rows': rows,
+                    'rice_prices': sorted(rice_prices.items())}
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(self.SNAPSHOT_FILE))
+        _fsync_directory(self.directory)
+
+    def add(self, payment):
+        """Insert a payment and return its new id"""
+        return self.add_many([payment])[0]
+
+    def add_many(self, payments):
+        """Insert payments and return their new ids; the whole batch shares one fsync
+
+        All or nothing: every payment is checked and encoded before any of
+        them is written or applied, so a bad payment leaves the store as it
+        was and the batch can be retried without adding anything twice.
+        """
+        payments = list(payments)
+        _check_amounts(payments)
+        with self._lock:
+            added = []
+            payment_id = self._last_id
+            for payment in payments:
+                payment_id = self.id_allocator.next_after(payment_id)
+                data = {col: payment[col] for col in EDITABLE_COLUMNS + ['tanggal_input']}
+                data['id'] = payment_id
+                data['versi'] = 1
+                added.append((payment_id, data))
+            # One write, so the batch reaches the journal whole
+            self._journal.write(''.join(self._record_line(self._seq + i, 'add', payment_id, data)
+                                        for i, (payment_id, data) in enumerate(added, 1)))
+            for payment_id, data in added:
+                self._seq += 1
+                self._apply('add', payment_id, data)
+            self._journal_records += len(added)
+            seq = self._seq
+        if added:
+            self._commit(seq)
+        return [payment_id for payment_id, _ in added]
+
+    def get(self, payment_id):
+        """Get a single payment by id, or None"""
+        with self._lock:
+            return self._payments.get(payment_id)
+
+    def update(self, payment_id, payment, expected_version=None):
+        """Update the editable fields of a payment; returns True if it existed
+
+        With ``expected_version`` the update only applies if the payment is
+        still at that versi, and raises VersionConflict otherwise.
+        """
+        _check_amounts([payment])
+        with self._lock:
+            if payment_id not in self._payments and expected_version is None:
+                return False
+            _check_version(payment_id, expected_version, self._payments.get(payment_id))
+            seq = self._append('update', payment_id, {col: payment[col] for col in EDITABLE_COLUMNS})
+        self._commit(seq)
+        return True
+
+    def delete(self, payment_id, expected_version=None):
+        """Delete a payment; returns True if it existed
+
+        With ``expected_version`` the delete only applies if the payment is
+        still at that versi, and raises VersionConflict otherwise.
+        """
+        with self._lock:
+            if payment_id not in self._payments and expected_version is None:
+                return False
+            _check_version(payment_id, expected_version, self._payments.get(payment_id))
+            seq = self._append('delete', payment_id)
+        self._commit(seq)
+        return True
+
+    def clear(self):
+        """Delete every payment"""
+        with self._lock:
+            seq = self._append('clear', None)
+        self._commit(seq)
+
+    def rice_price_history(self):
+        """Reference rice prices per kg as (tanggal, harga) pairs, earliest first"""
+        with self._lock:
+            return sorted(self._rice_prices.items())
+
+    def set_rice_price(self, tanggal, harga):
+        """Make ``harga`` the reference price from ``tanggal`` on, replacing one set for the same day"""
+        with self._lock:
+            seq = self._append('set_price', tanggal, float(harga))
+        self._commit(seq)
+
+    def remove_rice_price(self, tanggal):
+        with self._lock:
+            seq = self._append('remove_price', tanggal)
+        self._commit(seq)
+
+    # -- reads ----------------------------------------------------------------
+
+    @property
+    def version(self):
+        """Ledger version; changes whenever any payment changes"""
+        return self._seq
+
+    def count(self, filters=None):
+        """Number of stored payments, or of those matching a PaymentFilter"""
+        with self._lock:
+            return self._payments.count(filters)
+
+    def summary(self):
+        """Running totals: count, total_bayar, kembalian and per-category breakdowns"""
+        with self._lock:
+            return self._totals.summary()
+
+    def rollup(self, filters=None):
+        """Rollup cube cells matching a PaymentFilter (see RollupCube.cells)"""
+        with self._lock:
+            return self._cube.cells(filters)
+
+    def search(self, query, limit=20):
+        """Ids of payments whose nama matches the query, best matches first"""
+        with self._lock:
+            return self._names.search(query, limit)
+
+    def recent(self, limit):
+        """The most recent payments as a new DataFrame, oldest first"""
+        with self._lock:
+            return self._payments.tail(limit)
+
+    def page(self, offset, limit, sort_by='id', descending=False, filters=None):
+        """One page of payments as a new DataFrame, sorted by one of SORT_COLUMNS"""
+        if sort_by not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by {sort_by!r}")
+        with self._lock:
+            return self._payments.page(offset, limit, sort_by, descending, filters)
+
+    def iter_chunks(self, columns, chunk_size=5000, filters=None):
+        """Yield payments in id order as lists of value tuples, chunk_size rows at a time
+
+        The lock is only held while one chunk is copied out, so writers keep
+        going during a long export. Only payments matching ``filters`` (a
+        PaymentFilter) are yielded, if given.
+        """
+        last_id = 0
+        while True:
+            with self._lock:
+                rows, scanned_id = self._payments.rows_after(last_id, chunk_size, columns, filters)
+            if scanned_id == last_id:
+                return
+            last_id = scanned_id
+            if rows:
+                yield rows
+
+    def close(self):
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+        with self._lock:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+
+
+# Tells the writer thread to stop once everything queued before it is written
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """Adds payments to a store from a background thread, so callers never wait on the disk
+
+    enqueue() returns at once. The writer thread takes payments off the
+    queue in batches of at most ``batch_size``, waiting no longer than
+    ``max_delay`` seconds for a batch to fill, and stores each batch with
+    one add_many() (one transaction or fsync). A batch that fails on the
+    disk or database is retried every ``retry_delay`` seconds and the error
+    kept in ``last_error``. A batch the store refuses for any other reason,
+    such as a ValueError or a constraint, is retried one payment at a time;
+    payments refused on their own are skipped and listed in ``failed``
+    with their error, so one bad payment neither blocks the queue nor holds
+    back the rest of its batch.
+    close() writes everything still queued and runs at interpreter exit.
+    """
+
+    def __init__(self, store, batch_size=500, max_delay=0.05, retry_delay=1.0):
+        self.store = store
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.last_error = None
+        # (payment, error) for every payment the store refused
+        self.failed = []
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._enqueued = 0
+        self._written = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='payment-writer', daemon=True)
+        self._thread.start()
+        # Bounded, so a store that keeps failing cannot hang shutdown
+        atexit.register(self.close, 30)
+
+    @property
+    def pending(self):
+        """Payments enqueued but neither stored nor skipped yet"""
+        with self._cond:
+            return self._enqueued - self._written
+
+    def enqueue(self, payment):
+        """Queue a payment to be added to the store"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("WriteBehindQueue is closed")
+            self._enqueued += 1
+            # Put under the condition so close() cannot slip its stop marker in ahead of us
+            self._queue.put(payment)
+
+    def flush(self, timeout=None):
+        """Wait until every payment enqueued so far is stored or skipped; returns False on timeout"""
+        with self._cond:
+            target = self._enqueued
+            return self._cond.wait_for(lambda: self._written >= target, timeout)
+
+    def close(self, timeout=None):
+        """Store everything still queued and stop the writer thread"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        """Block for the next payment, then gather more until the batch is full or max_delay passes"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while batch[-1] is not _STOP and len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = self._next_batch()
+            if batch[-1] is _STOP:
+                stopping = True
+                batch.pop()
+            # Whole batches until the store refuses one, then one payment at a time
+            whole = True
+            while batch:
+                chunk = batch if whole else batch[:1]
+                try:
+                    self.store.add_many(chunk)
+                except (OSError, sqlite3.OperationalError) as error:
+                    _logger.exception("Writing %d queued payments failed, retrying", len(chunk))
+                    self.last_error = error
+                    time.sleep(self.retry_delay)
+                    continue
+                except Exception as error:
+                    # add_many stores all of a batch or nothing, so none of it is in yet
+                    if len(chunk) > 1:
+                        whole = False
+                        continue
+                    _logger.exception("Skipping a queued payment the store refused")
+                    self.failed.append((chunk[0], error))
+                self.last_error = None
+                with self._cond:
+                    self._written += len(chunk)
+                    self._cond.notify_all()
+                batch = batch[len(chunk):]
+
+
+def open_payment_store():
+    """Open the payment store selected by the ZAKAT_STORAGE environment variable"""
+    id_allocator = IdAllocator(
+        replica_id=int(os.environ.get("ZAKAT_REPLICA_ID", "0")),
+        replica_count=int(os.environ.get("ZAKAT_REPLICA_COUNT", "1"))
+    )
+    if os.environ.get("ZAKAT_STORAGE", "sqlite") == "journal":
+        return JournalPaymentStore(os.environ.get("ZAKAT_JOURNAL_DIR", "zakat_journal"), id_allocator)
+    return SQLitePaymentStore(os.environ.get("ZAKAT_DB_PATH", "zakat.db"), id_allocator)
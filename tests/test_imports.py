@@ -0,0 +1,111 @@
+import pandas as pd
+import pytest
+
+from exports import EXPORT_FORMATS, EXPORT_HEADERS, export_bytes
+from imports import check_payments, payment_errors, read_import_file, validate_payments
+from rice import RicePriceHistory
+from storage import EDITABLE_COLUMNS, SQLitePaymentStore
+
+FORM_PAYMENT = {'nama': 'Budi', 'jumlah_jiwa': 3, 'jenis_zakat': 'Zakat Fitrah', 'metode_pembayaran': 'Tunai',
+                'total_bayar': 112500.0, 'nominal_dibayar': 120000.0, 'tanggal_bayar': '2025-03-30'}
+
+
+def test_form_payment_rules():
+    assert payment_errors(FORM_PAYMENT) == []
+    assert payment_errors(dict(FORM_PAYMENT, nama='', jenis_zakat='', metode_pembayaran='Cek')) == [
+        "Nama harus diisi", "Jenis zakat harus diisi", "Metode pembayaran tidak valid"]
+    assert payment_errors(dict(FORM_PAYMENT, nominal_dibayar=100000.0)) == [
+        "Nominal dibayar tidak boleh kurang dari total bayar"]
+    assert payment_errors(dict(FORM_PAYMENT, jumlah_jiwa=1.5, total_bayar=0.0)) == [
+        "Jumlah jiwa tidak valid", "Total bayar harus lebih dari 0"]
+
+
+def test_import_rows_get_the_form_rules():
+    rows = [dict(FORM_PAYMENT, nama=''), dict(FORM_PAYMENT, jenis_zakat='Zakat Apa'),
+            dict(FORM_PAYMENT, nominal_dibayar=1000.0), dict(FORM_PAYMENT, tanggal_bayar='kemarin'), FORM_PAYMENT]
+    raw = pd.DataFrame({col: [str(row[col]) for row in rows] for col in FORM_PAYMENT})
+    _, messages = check_payments(raw, today='2025-04-01')
+    expected = [payment_errors(row) for row in rows[:3]] + [["Tanggal bayar tidak valid"], []]
+    assert [message.split('; ') if message else [] for message in messages] == expected
+
+
+def import_file(*rows, columns=None):
+    """A raw import file of text cells under the export headers"""
+    columns = columns or list(FORM_PAYMENT)
+    return pd.DataFrame([{EXPORT_HEADERS[col]: str(row.get(col, '')) for col in columns} for row in rows])
+
+
+@pytest.mark.parametrize('file_format', ['CSV', 'Excel'])
+def test_export_imports_back_unchanged(tmp_path, file_format):
+    store = SQLitePaymentStore(str(tmp_path / 'zakat.db'))
+    payments = [dict(FORM_PAYMENT, nama=nama, jumlah_jiwa=jiwa, total_bayar=total, nominal_dibayar=total + 500,
+                     kembalian=500.0, tanggal_bayar=f"2025-03-{day:02d}", tanggal_input="2025-03-31 08:00:00")
+                for nama, jiwa, total, day in [('Ani', 1, 37500.0, 1), ('Budi Santoso', 4, 150000.0, 12),
+                                               ('Citra', 2, 75000.25, 28)]]
+    store.add_many(payments)
+    data = export_bytes(store, file_format)
+    store.close()
+
+    extension = EXPORT_FORMATS[file_format][0]
+    valid, errors = validate_payments(read_import_file(f"zakat.{extension}", data), today='2025-04-01')
+    assert len(errors) == 0
+    assert valid.to_dict('records') == [{col: payment[col] for col in EDITABLE_COLUMNS} for payment in payments]
+
+
+def test_errors_name_file_rows_and_join_messages():
+    raw = import_file(FORM_PAYMENT, dict(FORM_PAYMENT, nama='', total_bayar='abc'), FORM_PAYMENT,
+                      dict(FORM_PAYMENT, metode_pembayaran='Cek', tanggal_bayar='31/02/2025'))
+    valid, errors = validate_payments(raw, today='2025-04-01')
+    assert len(valid) == 2
+    assert errors.to_dict('records') == [
+        {'Baris': 3, 'Kesalahan': "Nama harus diisi; Total bayar harus lebih dari 0"},
+        {'Baris': 5, 'Kesalahan': "Metode pembayaran tidak valid; Tanggal bayar tidak valid"},
+    ]
+
+
+def test_blank_jumlah_jiwa_counts_as_one():
+    raw = import_file(dict(FORM_PAYMENT, jumlah_jiwa=''), dict(FORM_PAYMENT, jumlah_jiwa='0'))
+    valid, errors = validate_payments(raw, today='2025-04-01')
+    assert valid['jumlah_jiwa'].tolist() == [1]
+    assert errors.to_dict('records') == [{'Baris': 3, 'Kesalahan': "Jumlah jiwa tidak valid"}]
+    columns = [col for col in FORM_PAYMENT if col != 'jumlah_jiwa']
+    valid, errors = validate_payments(import_file(FORM_PAYMENT, columns=columns), today='2025-04-01')
+    assert valid['jumlah_jiwa'].tolist() == [1]
+
+
+@pytest.mark.parametrize('value', ['inf', '-inf', '1e400'])
+def test_infinite_amounts_are_refused(value):
+    raw = import_file(dict(FORM_PAYMENT, total_bayar=value), dict(FORM_PAYMENT, nominal_dibayar=value))
+    valid, errors = validate_payments(raw, today='2025-04-01')
+    assert len(valid) == 0
+    assert "Total bayar" in errors['Kesalahan'][0]
+    assert "Nominal dibayar" in errors['Kesalahan'][1]
+
+
+def test_iso_and_day_first_dates_in_one_file():
+    dates = ['2025-03-05', '05/03/2025', '2025-03-06 00:00:00', '6/3/2025', '', '2025-13-01', '03-05-2025']
+    raw = import_file(*[dict(FORM_PAYMENT, tanggal_bayar=tanggal) for tanggal in dates])
+    valid, errors = validate_payments(raw, today='2025-04-01')
+    assert valid['tanggal_bayar'].tolist() == ['2025-03-05', '2025-03-05', '2025-03-06', '2025-03-06', '2025-04-01']
+    assert errors['Baris'].tolist() == [7, 8]
+    assert set(errors['Kesalahan']) == {"Tanggal bayar tidak valid"}
+
+
+def test_blank_fitrah_total_is_priced_from_rice_price():
+    raw = import_file(dict(FORM_PAYMENT, jumlah_jiwa='2', total_bayar=''),
+                      dict(FORM_PAYMENT, jenis_zakat='Zakat Mal', total_bayar=''))
+    valid, errors = validate_payments(raw, today='2025-04-01', harga_per_kg=15000)
+    assert valid['total_bayar'].tolist() == [75000.0]
+    assert valid['kembalian'].tolist() == [45000.0]
+    # Only Zakat Fitrah is priced from rice; a blank Zakat Mal total stays an error
+    assert errors.to_dict('records') == [{'Baris': 3, 'Kesalahan': "Total bayar harus lebih dari 0"}]
+
+
+def test_blank_fitrah_total_is_priced_as_of_its_date():
+    history = RicePriceHistory([('2025-03-01', 14000), ('2025-03-20', 16000)])
+    raw = import_file(*[dict(FORM_PAYMENT, jumlah_jiwa='1', total_bayar='', tanggal_bayar=tanggal)
+                        for tanggal in ['2025-03-19', '20/03/2025', '2025-02-28']])
+    valid, errors = validate_payments(raw, today='2025-04-01', price_history=history)
+    assert valid['total_bayar'].tolist() == [35000.0, 40000.0]
+    # No price was in effect yet, so the total cannot be derived
+    assert errors.to_dict('records') == [{'Baris': 4, 'Kesalahan': "Total bayar harus lebih dari 0"}]
@@ -0,0 +1,158 @@
+import http.client
+import json
+import socket
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import ingest
+from ingest import IngestBatcher, IngestHandler
+from storage import SQLitePaymentStore
+
+PAYMENT = {'nama': 'Budi', 'jumlah_jiwa': 3, 'jenis_zakat': 'Zakat Fitrah', 'metode_pembayaran': 'Tunai',
+           'total_bayar': 112500, 'nominal_dibayar': 120000, 'tanggal_bayar': '2025-03-30'}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLitePaymentStore(str(tmp_path / 'zakat.db'))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def server(store, monkeypatch):
+    monkeypatch.setattr(ingest, 'INGEST_TOKEN', 'rahasia')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), IngestHandler)
+    server.store = store
+    server.batcher = IngestBatcher(store, max_delay=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def raw_request(path, body, token):
+    body = json.dumps(body).encode('utf-8')
+    head = (f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+            f"Authorization: Bearer {token}\r\nContent-Length: {len(body)}\r\n\r\n")
+    return head.encode('ascii') + body
+
+
+def read_until_closed(sock):
+    data = b''
+    while chunk := sock.recv(65536):
+        data += chunk
+    return data
+
+
+@pytest.mark.parametrize('path, token, status', [('/payments', 'salah', 401), ('/lain', 'rahasia', 404)])
+def test_refused_request_closes_keep_alive_connection(server, store, path, token, status):
+    refused = raw_request(path, dict(PAYMENT, idempotency_key='a1'), token)
+    accepted = raw_request('/payments', dict(PAYMENT, idempotency_key='a2'), 'rahasia')
+    with socket.create_connection(server.server_address, timeout=5) as sock:
+        # Both on one socket: the unread body of the first must not be parsed as a request
+        sock.sendall(refused + accepted)
+        response = read_until_closed(sock)
+
+    head, _, body = response.partition(b'\r\n\r\n')
+    assert head.startswith(f"HTTP/1.1 {status}".encode())
+    assert b'Connection: close' in head
+    assert b'application/json' in head
+    assert 'error' in json.loads(body)
+    assert response.count(b'HTTP/1.1') == 1
+    assert store.count() == 0
+
+    with socket.create_connection(server.server_address, timeout=5) as sock:
+        sock.sendall(accepted)
+        head = sock.recv(65536).split(b'\r\n', 1)[0]
+    assert head == b'HTTP/1.1 200 OK'
+    assert store.count() == 1
+
+
+def test_connection_is_kept_alive_across_accepted_requests(server, store):
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    sockets = []
+    for key in ('k1', 'k2', 'k1'):
+        conn.request('POST', '/payments', json.dumps(dict(PAYMENT, idempotency_key=key)),
+                     {'Authorization': 'Bearer rahasia'})
+        response = conn.getresponse()
+        assert response.status == 200
+        results = json.loads(response.read())['results']
+        sockets.append(conn.sock)
+    conn.close()
+    assert results[0]['status'] == 'duplicate'
+    assert sockets[0] is sockets[1] is sockets[2]
+    assert store.count() == 2
+
+
+def test_key_repeated_within_a_batch_adds_one_payment(store):
+    results = ingest.ingest(store, [dict(PAYMENT, idempotency_key='dup'), dict(PAYMENT, idempotency_key='dup')])
+    assert [result['status'] for result in results] == ['created', 'duplicate']
+    assert results[0]['id'] == results[1]['id']
+    assert store.count() == 1
+
+
+def test_retried_request_is_a_duplicate(store):
+    first = ingest.ingest(store, [dict(PAYMENT, idempotency_key='r1'), dict(PAYMENT, idempotency_key='r2')])
+    retried = ingest.ingest(store, [dict(PAYMENT, idempotency_key='r1'), dict(PAYMENT, idempotency_key='r2')])
+    assert [result['status'] for result in retried] == ['duplicate', 'duplicate']
+    assert [result['id'] for result in retried] == [result['id'] for result in first]
+    assert store.count() == 2
+
+
+def test_invalid_payments_are_reported_and_valid_ones_added(store):
+    results = ingest.ingest(store, [
+        dict(PAYMENT, idempotency_key='v1'),
+        dict(PAYMENT, idempotency_key='x1', nama=''),
+        dict(PAYMENT, idempotency_key='x2', total_bayar=float('inf')),
+        dict(PAYMENT),
+        dict(PAYMENT, idempotency_key='v2', tanggal_bayar='2025-03-30T10:00:00'),
+    ])
+    assert [result['status'] for result in results] == ['created', 'invalid', 'invalid', 'invalid', 'created']
+    assert "Nama harus diisi" in results[1]['errors']
+    assert "Total bayar tidak valid" in results[2]['errors']
+    assert results[3]['errors'] == ["Idempotency key harus diisi"]
+    assert store.count() == 2
+    assert store.get(results[4]['id'])['tanggal_bayar'] == '2025-03-30'
+
+
+class FailingStore:
+    """Refuses any add_once that includes a payment named 'Gagal'"""
+
+    def __init__(self, store):
+        self.store = store
+        self.calls = []
+
+    def add_once(self, keys, payments):
+        self.calls.append(len(payments))
+        if any(payment['nama'] == 'Gagal' for payment in payments):
+            raise RuntimeError("gagal")
+        return self.store.add_once(keys, payments)
+
+
+def test_batcher_runs_requests_alone_when_the_shared_batch_fails(store):
+    failing = FailingStore(store)
+    batcher = IngestBatcher(failing, max_delay=0.2)
+    outcomes = {}
+
+    def submit(key, nama):
+        try:
+            outcomes[key] = batcher.submit([dict(PAYMENT, idempotency_key=key, nama=nama)])
+        except RuntimeError as error:
+            outcomes[key] = error
+
+    threads = [threading.Thread(target=submit, args=args) for args in (('b1', 'Ani'), ('b2', 'Gagal'), ('b3', 'Citra'))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failing.calls[0] == 3
+    assert sorted(failing.calls[1:]) == [1, 1, 1]
+    assert isinstance(outcomes['b2'], RuntimeError)
+    assert outcomes['b1'][0]['status'] == outcomes['b3'][0]['status'] == 'created'
+    assert store.count() == 2
@@ -0,0 +1,478 @@
+import json
+import os
+import random
+
+import pytest
+
+import storage
+from ledger import PaymentFilter
+from storage import SORT_COLUMNS, JournalPaymentStore, SQLitePaymentStore, VersionConflict, WriteBehindQueue
+
+NAMES = ['Ahmad Fauzi', 'ahmad', 'Siti Aminah', 'Budi  Santoso', 'Nur Aini', 'Muhammad Nur',
+         'Aminah', 'Fauziah Ahmad', 'Rahmat', 'Dewi Sartika', 'Abdul Rahman', 'Rahma']
+JENIS = ['Zakat Fitrah', 'Zakat Mal', 'Infaq', 'Sedekah']
+METODE = ['Tunai', 'Transfer', 'QRIS']
+
+
+def make_payment(rng, **fields):
+    total_bayar = rng.randrange(1, 500) * 2500
+    payment = {
+        'nama': rng.choice(NAMES),
+        'jumlah_jiwa': rng.randint(1, 6),
+        'jenis_zakat': rng.choice(JENIS),
+        'metode_pembayaran': rng.choice(METODE),
+        'total_bayar': float(total_bayar),
+        'nominal_dibayar': float(total_bayar + rng.choice([0, 0, 500, 5000])),
+        'tanggal_bayar': f"2025-03-{rng.randint(1, 31):02d}",
+        'tanggal_input': "2025-03-01 08:00:00",
+    }
+    payment.update(fields)
+    payment['kembalian'] = payment['nominal_dibayar'] - payment['total_bayar']
+    return payment
+
+
+@pytest.fixture(params=['sqlite', 'journal'])
+def open_store(request, tmp_path):
+    """Opens (or reopens) a store of each kind at the same location; tests close all but the last"""
+    stores = []
+
+    def open_store(**kwargs):
+        if request.param == 'sqlite':
+            store = SQLitePaymentStore(str(tmp_path / 'zakat.db'), **kwargs)
+        else:
+            store = JournalPaymentStore(str(tmp_path / 'journal'), commit_delay=0, **kwargs)
+        stores.append(store)
+        return store
+
+    yield open_store
+    if stores:
+        stores[-1].close()
+
+
+def fill(store, rng, count=300, delete_fraction=0.3):
+    """Add payments to a store, delete some at random and return the rest by id"""
+    model = {}
+    for _ in range(count // 50):
+        payments = [make_payment(rng) for _ in range(50)]
+        model.update(zip(store.add_many(payments), payments))
+    for payment_id in rng.sample(sorted(model), int(len(model) * delete_fraction)):
+        assert store.delete(payment_id)
+        del model[payment_id]
+    for payment_id in rng.sample(sorted(model), 20):
+        payment = make_payment(rng)
+        store.update(payment_id, payment)
+        model[payment_id] = {**payment, 'tanggal_input': model[payment_id]['tanggal_input']}
+    return model
+
+
+def matches(payment, filters):
+    return ((not filters.date_from or payment['tanggal_bayar'] >= filters.date_from)
+            and (not filters.date_to or payment['tanggal_bayar'] <= filters.date_to)
+            and (not filters.jenis_zakat or payment['jenis_zakat'] in filters.jenis_zakat)
+            and (not filters.metode_pembayaran or payment['metode_pembayaran'] in filters.metode_pembayaran))
+
+
+def random_filter(rng):
+    dates = sorted(f"2025-03-{rng.randint(1, 31):02d}" for _ in range(2))
+    return PaymentFilter(
+        date_from=rng.choice([None, dates[0]]),
+        date_to=rng.choice([None, dates[1]]),
+        jenis_zakat=tuple(rng.sample(JENIS, rng.choice([0, 1, 2]))),
+        metode_pembayaran=tuple(rng.sample(METODE, rng.choice([0, 1, 2]))),
+    )
+
+
+def brute_force_page(model, offset, limit, sort_by, descending, filters=None):
+    ids = [payment_id for payment_id, payment in model.items() if not filters or matches(payment, filters)]
+    key = (lambda payment_id: payment_id) if sort_by == 'id' else (
+        lambda payment_id: (model[payment_id][sort_by], payment_id))
+    return sorted(ids, key=key, reverse=descending)[offset:offset + limit]
+
+
+def brute_force_search(model, query, limit):
+    query = ' '.join(query.casefold().split())
+    names = {payment_id: ' '.join(payment['nama'].casefold().split()) for payment_id, payment in model.items()}
+    if len(query) < 3:
+        found = [payment_id for payment_id, name in names.items()
+                 if any(word.startswith(query) for word in name.split())]
+    else:
+        found = [payment_id for payment_id, name in names.items() if query in name]
+    return sorted(found, key=lambda payment_id: (not names[payment_id].startswith(query), -payment_id))[:limit]
+
+
+# -- both stores ----------------------------------------------------------------
+
+
+def test_pages_match_brute_force_after_random_deletes(open_store):
+    rng = random.Random(10)
+    store = open_store()
+    model = fill(store, rng)
+    for sort_by in SORT_COLUMNS:
+        for descending in (False, True):
+            for offset in (0, 25, len(model) - 10, len(model) + 5):
+                page = store.page(offset, 25, sort_by, descending)
+                assert page['id'].tolist() == brute_force_page(model, offset, 25, sort_by, descending)
+    row = store.page(0, 1, 'id', True).iloc[0]
+    assert row['nama'] == model[row['id']]['nama']
+
+
+def test_search_matches_brute_force_scan(open_store):
+    rng = random.Random(11)
+    store = open_store()
+    model = fill(store, rng)
+    queries = ['a', 'ah', 'AHMAD', 'nur', 'aminah', 'min', ' budi  santoso ', 'rahm', 'zz', 'i s', 'x']
+    for query in queries:
+        for limit in (5, 1000):
+            assert store.search(query, limit) == brute_force_search(model, query, limit), query
+
+
+def test_random_filters_match_brute_force(open_store):
+    rng = random.Random(12)
+    store = open_store()
+    model = fill(store, rng)
+    for _ in range(40):
+        filters = random_filter(rng)
+        selected = [payment for payment in model.values() if matches(payment, filters)]
+        assert store.count(filters) == len(selected)
+        assert store.page(0, 40, 'tanggal_bayar', True, filters)['id'].tolist() == \
+            brute_force_page(model, 0, 40, 'tanggal_bayar', True, filters)
+        cells = {}
+        for payment in selected:
+            cell = cells.setdefault((payment['tanggal_bayar'], payment['jenis_zakat'],
+                                     payment['metode_pembayaran']), [0, 0.0, 0])
+            cell[0] += 1
+            cell[1] += payment['total_bayar']
+            cell[2] += payment['jumlah_jiwa']
+        assert store.rollup(filters) == [key + tuple(cell) for key, cell in sorted(cells.items())]
+        exported = [row for chunk in store.iter_chunks(['nama'], chunk_size=17, filters=filters) for row in chunk]
+        assert len(exported) == len(selected)
+
+
+def test_summary_survives_reopen(open_store):
+    rng = random.Random(13)
+    store = open_store()
+    model = fill(store, rng)
+    summary = store.summary()
+    assert summary['count'] == len(model)
+    assert summary['total_bayar'] == sum(payment['total_bayar'] for payment in model.values())
+    store.close()
+    reopened = open_store()
+    assert reopened.summary() == summary
+    assert reopened.page(0, len(model), 'id', False)['id'].tolist() == sorted(model)
+
+
+def test_deleted_ids_are_not_reused_after_reopen(open_store):
+    rng = random.Random(14)
+    store = open_store()
+    ids = store.add_many([make_payment(rng) for _ in range(3)])
+    assert store.delete(ids[-1])
+    store.close()
+    store = open_store()
+    assert store.add(make_payment(rng)) == ids[-1] + 1
+
+
+def test_non_finite_amounts_are_refused_before_writing(open_store):
+    rng = random.Random(15)
+    store = open_store()
+    good = make_payment(rng)
+    with pytest.raises(ValueError):
+        store.add_many([good, make_payment(rng, total_bayar=float('inf'))])
+    assert store.count() == 0
+    store.close()
+    assert open_store().count() == 0
+
+
+def test_rice_price_history_survives_reopen(open_store):
+    store = open_store()
+    store.set_rice_price('2025-03-01', 15000)
+    store.set_rice_price('2025-02-01', 14000)
+    store.set_rice_price('2025-03-01', 15500)
+    store.set_rice_price('2025-04-01', 16000)
+    store.remove_rice_price('2025-04-01')
+    store.clear()
+    store.close()
+    assert open_store().rice_price_history() == [('2025-02-01', 14000.0), ('2025-03-01', 15500.0)]
+
+
+
+def test_versi_goes_up_on_each_update_and_survives_reopen(open_store):
+    rng = random.Random(17)
+    store = open_store()
+    payment_id = store.add(make_payment(rng))
+    assert store.get(payment_id)['versi'] == 1
+    for versi in (1, 2, 3):
+        assert store.update(payment_id, make_payment(rng, nama='Aminah'), expected_version=versi)
+        assert store.get(payment_id)['versi'] == versi + 1
+    store.close()
+    store = open_store()
+    assert store.get(payment_id)['versi'] == 4
+    assert store.update(payment_id, make_payment(rng), expected_version=4)
+    assert store.get(payment_id)['versi'] == 5
+
+
+def test_stale_update_raises_with_current_payment(open_store):
+    rng = random.Random(18)
+    store = open_store()
+    payment_id = store.add(make_payment(rng))
+    assert store.update(payment_id, make_payment(rng, nama='Rahmat'), expected_version=1)
+    with pytest.raises(VersionConflict) as conflict:
+        store.update(payment_id, make_payment(rng, nama='Rahma'), expected_version=1)
+    assert conflict.value.payment_id == payment_id
+    assert conflict.value.expected_version == 1
+    assert conflict.value.current['nama'] == 'Rahmat'
+    assert conflict.value.current['versi'] == 2
+    assert store.get(payment_id)['nama'] == 'Rahmat'
+
+
+def test_stale_delete_raises_and_keeps_payment(open_store):
+    rng = random.Random(19)
+    store = open_store()
+    payment_id = store.add(make_payment(rng))
+    assert store.update(payment_id, make_payment(rng), expected_version=1)
+    with pytest.raises(VersionConflict) as conflict:
+        store.delete(payment_id, expected_version=1)
+    assert conflict.value.current['versi'] == 2
+    assert store.count() == 1
+    assert store.delete(payment_id, expected_version=2)
+    assert store.get(payment_id) is None
+
+
+def test_versioned_change_of_deleted_payment_raises(open_store):
+    rng = random.Random(20)
+    store = open_store()
+    payment_id = store.add(make_payment(rng))
+    assert store.delete(payment_id)
+    assert not store.update(payment_id, make_payment(rng))
+    assert not store.delete(payment_id)
+    with pytest.raises(VersionConflict) as conflict:
+        store.update(payment_id, make_payment(rng), expected_version=1)
+    assert conflict.value.current is None
+    with pytest.raises(VersionConflict) as conflict:
+        store.delete(payment_id, expected_version=1)
+    assert conflict.value.current is None
+    assert store.count() == 0
+
+# -- journal recovery -------------------------------------------------------------
+
+
+@pytest.fixture
+def journal_dir(tmp_path):
+    return str(tmp_path / 'journal')
+
+
+def journal_lines(directory, name=JournalPaymentStore.JOURNAL_FILE):
+    with open(os.path.join(directory, name), encoding='utf-8') as f:
+        return f.readlines()
+
+
+def test_torn_journal_line_is_truncated(journal_dir):
+    rng = random.Random(20)
+    store = JournalPaymentStore(journal_dir, commit_delay=0)
+    store.add_many([make_payment(rng) for _ in range(3)])
+    store.close()
+    path = os.path.join(journal_dir, JournalPaymentStore.JOURNAL_FILE)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('[4,"add",4,["Setengah')
+
+    store = JournalPaymentStore(journal_dir, commit_delay=0)
+    assert store.count() == 3
+    assert len(journal_lines(journal_dir)) == 3
+    store.add(make_payment(rng, nama='Setelah Crash'))
+    store.close()
+
+    store = JournalPaymentStore(journal_dir, commit_delay=0)
+    assert store.count() == 4
+    assert store.search('setelah crash') == [4]
+    store.close()
+
+
+def test_interrupted_compaction_is_finished_on_open(journal_dir):
+    rng = random.Random(21)
+    store = JournalPaymentStore(journal_dir, commit_delay=0)
+    ids = store.add_many([make_payment(rng) for _ in range(5)])
+    store.close()
+    # Crash right after rotating the journal, before the snapshot was written,
+    # with one more change already in the new journal
+    os.replace(os.path.join(journal_dir, JournalPaymentStore.JOURNAL_FILE),
+               os.path.join(journal_dir, JournalPaymentStore.COMPACTING_FILE))
+    edited = make_payment(rng, nama='Diubah')
+    with open(os.path.join(journal_dir, JournalPaymentStore.JOURNAL_FILE), 'w', encoding='utf-8') as f:
+        f.write(JournalPaymentStore._record_line(6, 'update', ids[0], edited))
+
+    store = JournalPaymentStore(journal_dir, commit_delay=0)
+    assert store.count() == 5
+    assert store.get(ids[0])['nama'] == 'Diubah'
+    assert store.get(ids[0])['versi'] == 2
+    assert not os.path.exists(os.path.join(journal_dir, JournalPaymentStore.COMPACTING_FILE))
+    assert os.path.exists(os.path.join(journal_dir, JournalPaymentStore.SNAPSHOT_FILE))
+    assert journal_lines(journal_dir) == []
+    store.close()
+
+    store = JournalPaymentStore(journal_dir, commit_delay=0)
+    assert store.count() == 5
+    assert store.get(ids[0])['nama'] == 'Diubah'
+    store.close()
+
+
+def test_snapshot_plus_journal_tail_replays(journal_dir):
+    rng = random.Random(22)
+    store = JournalPaymentStore(journal_dir, compact_every=20, commit_delay=0)
+    for _ in range(7):
+        store.add_many([make_payment(rng) for _ in range(5)])
+    # Wait for the compaction the journal's growth started
+    store._compaction_thread.join()
+    store.set_rice_price('2025-03-01', 15000)
+    store._compaction_thread.join()
+    store.delete(3)
+    store.update(4, make_payment(rng, nama='Ekor Jurnal'))
+    store.set_rice_price('2025-03-20', 16000)
+    expected = store.page(0, 100, 'id', False)
+    summary = store.summary()
+    store.close()
+
+    with open(os.path.join(journal_dir, JournalPaymentStore.SNAPSHOT_FILE), encoding='utf-8') as f:
+        snapshot = json.load(f)
+    assert snapshot['rows'] and len(journal_lines(journal_dir)) < 35
+
+    store = JournalPaymentStore(journal_dir, compact_every=20, commit_delay=0)
+    assert store.summary() == summary
+    assert store.page(0, 100, 'id', False).equals(expected)
+    assert store.get(4)['nama'] == 'Ekor Jurnal'
+    assert store.rice_price_history() == [('2025-03-01', 15000.0), ('2025-03-20', 16000.0)]
+    store.close()
+
+
+def test_last_id_survives_compaction(journal_dir):
+    rng = random.Random(23)
+    store = JournalPaymentStore(journal_dir, compact_every=4, commit_delay=0)
+    ids = store.add_many([make_payment(rng) for _ in range(3)])
+    store.delete(ids[-1])
+    store.add(make_payment(rng))
+    store._compaction_thread.join()
+    store.delete(ids[-1] + 1)
+    store.close()
+
+    store = JournalPaymentStore(journal_dir, compact_every=4, commit_delay=0)
+    assert store.add(make_payment(rng)) == ids[-1] + 2
+    store.close()
+
+
+# -- one SQLite file, several connections -------------------------------------------
+
+
+def derived_state(store):
+    return store.summary(), store.rollup(), [store.search(query, 1000) for query in ('a', 'nur', 'ahmad', 'rahm')]
+
+
+def test_sqlite_connections_catch_up_with_each_other(tmp_path, monkeypatch):
+    # A short change log, so a connection left behind has to reload
+    monkeypatch.setattr(storage, 'CHANGE_LOG_KEEP', 25)
+    rng = random.Random(30)
+    path = str(tmp_path / 'zakat.db')
+    writers = [SQLitePaymentStore(path), SQLitePaymentStore(path)]
+    # Only read now and then, so it falls further behind than the log reaches
+    laggard = SQLitePaymentStore(path)
+    keys = []
+    for step in range(120):
+        store = rng.choice(writers)
+        ids = store.page(0, 10 ** 6)['id'].tolist()
+        action = rng.random()
+        if action < 0.3 or not ids:
+            store.add_many([make_payment(rng) for _ in range(rng.randint(1, 8))])
+        elif action < 0.5:
+            batch = [rng.choice(keys) if keys and rng.random() < 0.3 else f"key-{step}-{i}" for i in range(4)]
+            keys.extend(batch)
+            store.add_once(batch, [make_payment(rng) for _ in batch])
+        elif action < 0.75:
+            store.update(rng.choice(ids), make_payment(rng))
+        elif action < 0.97:
+            store.delete(rng.choice(ids))
+        else:
+            store.clear()
+
+        fresh = SQLitePaymentStore(path)
+        expected = derived_state(fresh)
+        fresh.close()
+        for other in writers:
+            assert derived_state(other) == expected, step
+        if step % 40 == 39:
+            assert derived_state(laggard) == expected, step
+    for store in writers + [laggard]:
+        store.close()
+
+
+# -- write-behind queue -----------------------------------------------------------
+
+
+class StubStore:
+    """Fails add_many with OSError ``os_errors`` times, then refuses any batch holding a payment named 'Tolak'"""
+
+    def __init__(self, os_errors=0):
+        self.os_errors = os_errors
+        self.writer = None
+        self.calls = []
+        self.errors_seen = []
+        self.stored = []
+
+    def add_many(self, payments):
+        self.calls.append([payment['nama'] for payment in payments])
+        self.errors_seen.append(self.writer.last_error)
+        if self.os_errors:
+            self.os_errors -= 1
+            raise OSError("disk penuh")
+        if any(payment['nama'] == 'Tolak' for payment in payments):
+            raise ValueError("pembayaran ditolak")
+        self.stored.extend(payment['nama'] for payment in payments)
+
+
+def write_behind(store, **kwargs):
+    writer = WriteBehindQueue(store, retry_delay=0.01, **kwargs)
+    store.writer = writer
+    return writer
+
+
+def test_write_behind_batches_and_retries_disk_errors():
+    store = StubStore(os_errors=1)
+    writer = write_behind(store, batch_size=3, max_delay=0.2)
+    names = ['Ani', 'Budi', 'Citra', 'Dedi', 'Euis']
+    for nama in names:
+        writer.enqueue({'nama': nama})
+    assert writer.flush(timeout=5)
+    assert writer.pending == 0
+    assert store.calls == [names[:3], names[:3], names[3:]]
+    # The retry sees the error it is retrying, and a stored batch clears it
+    assert isinstance(store.errors_seen[1], OSError)
+    assert writer.last_error is None
+    assert store.stored == names
+    assert writer.failed == []
+    writer.close()
+
+
+def test_write_behind_stores_a_refused_batch_one_payment_at_a_time():
+    store = StubStore()
+    writer = write_behind(store, max_delay=0.2)
+    for nama in ('Ani', 'Tolak', 'Citra'):
+        writer.enqueue({'nama': nama})
+    assert writer.flush(timeout=5)
+    assert writer.pending == 0
+    assert store.calls == [['Ani', 'Tolak', 'Citra'], ['Ani'], ['Tolak'], ['Citra']]
+    assert store.stored == ['Ani', 'Citra']
+    [(payment, error)] = writer.failed
+    assert payment == {'nama': 'Tolak'}
+    assert isinstance(error, ValueError)
+    assert writer.last_error is None
+    writer.close()
+
+
+def test_write_behind_close_stores_everything_queued():
+    store = StubStore(os_errors=1)
+    # A long max_delay: close() must not wait for the batch to fill
+    writer = write_behind(store, max_delay=60)
+    for nama in ('Ani', 'Budi'):
+        writer.enqueue({'nama': nama})
+    writer.close(timeout=5)
+    assert not writer._thread.is_alive()
+    assert writer.pending == 0
+    assert store.stored == ['Ani', 'Budi']
+    with pytest.raises(RuntimeError):
+        writer.enqueue({'nama': 'Citra'})